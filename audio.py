@@ -1,8 +1,123 @@
 import asyncio
+import logging
+import queue
+import threading
+import time
+from math import gcd
+
+import numpy as np
 import pyaudio
+from scipy.signal import firwin
 
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
+# Some ALSA devices report dozens of channels, only the first two are used
+MAX_DEVICE_CHANNELS = 2
+
+
+def native_format(p, device_index, input):
+    """
+    Returns the (sample_rate, channels) a device runs at natively.
+    """
+    if device_index is None:
+        info = (
+            p.get_default_input_device_info()
+            if input
+            else p.get_default_output_device_info()
+        )
+    else:
+        info = p.get_device_info_by_index(device_index)
+    max_channels = info["maxInputChannels"] if input else info["maxOutputChannels"]
+    channels = max(1, min(int(max_channels), MAX_DEVICE_CHANNELS))
+    return int(info["defaultSampleRate"]), channels
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler for interleaved PCM16 that also mixes
+    between channel counts.
+
+    Blocks have a fixed size chosen so every block starts on the same filter
+    phase, which lets the gather indices and per-output filter taps be
+    computed once. All work buffers are preallocated, processing a block is a
+    single gather and a row-wise dot product.
+    """
+
+    def __init__(
+        self,
+        in_rate,
+        out_rate,
+        in_channels=1,
+        out_channels=1,
+        periods=1,
+        taps_per_phase=24,
+    ):
+        """
+        :param in_rate: Sample rate of the input.
+        :param out_rate: Sample rate of the output.
+        :param in_channels: Channels of the input, mixed down to mono.
+        :param out_channels: Channels of the output, the mono signal is copied to each.
+        :param periods: Block size in resampling periods, a period being the
+            smallest number of input frames that maps to a whole number of
+            output frames.
+        :param taps_per_phase: Filter taps per polyphase branch.
+        """
+        g = gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.in_frames = periods * self.down
+        self.out_frames = periods * self.up
+        self.taps = taps_per_phase
+
+        # Low-pass at the lower of the two Nyquist rates, in units of the
+        # upsampled rate's Nyquist. Scaled by `up` to make up for the zeros
+        # upsampling inserts.
+        cutoff = 0.9 / max(self.up, self.down)
+        h = firwin(self.up * self.taps, cutoff, window=("kaiser", 8.0)) * self.up
+
+        # Output j sits at upsampled position j * down, i.e. after input frame
+        # n = j * down // up, on filter phase j * down % up
+        positions = np.arange(self.out_frames) * self.down
+        newest = positions // self.up
+        phases = positions % self.up
+        k = np.arange(self.taps)
+        self.indices = (self.taps - 1 + newest)[:, None] - k
+        self.filters = h[phases[:, None] + k * self.up].astype(np.float32)
+
+        # Mono input with the previous block's last taps - 1 frames in front
+        self.history = np.zeros(self.taps - 1 + self.in_frames, dtype=np.float32)
+        self.gathered = np.empty((self.out_frames, self.taps), dtype=np.float32)
+        self.mono = np.empty(self.out_frames, dtype=np.float32)
+        self.output = np.empty((self.out_frames, self.out_channels), dtype=np.int16)
+
+    def latency_at(self, in_rate):
+        """
+        Delay the filter adds in seconds, given the input sample rate.
+        """
+        return (self.up * self.taps - 1) / 2 / (self.up * in_rate)
+
+    def process(self, data):
+        """
+        Resamples one block of `in_frames` interleaved PCM16 frames and returns
+        `out_frames` interleaved PCM16 frames as bytes.
+        """
+        samples = np.frombuffer(data, dtype=np.int16)
+        samples = samples.reshape(self.in_frames, self.in_channels)
+        block = self.history[self.taps - 1 :]
+        if self.in_channels == 1:
+            block[:] = samples[:, 0]
+        else:
+            np.mean(samples, axis=1, out=block)
+
+        np.take(self.history, self.indices, out=self.gathered)
+        np.einsum("jk,jk->j", self.gathered, self.filters, out=self.mono)
+        self.history[: self.taps - 1] = self.history[self.in_frames :]
+
+        np.clip(self.mono, -32768, 32767, out=self.mono)
+        self.output[:] = self.mono[:, None]
+        return self.output.tobytes()
 
 
 class AudioRecorder:
@@ -12,20 +127,107 @@ class AudioRecorder:
         sample_rate=16000,
         frames_per_buffer=512,
         callback=None,
+        native=True,
     ):
+        """
+        Records mono PCM16 at `sample_rate`. With `native`, the device is
+        opened at its own rate and channel count and converted on a worker
+        thread, instead of leaving that to PortAudio or the ALSA plugin layer.
+        The callback then runs on the worker thread and its return value is
+        ignored.
+        """
         self.sample_rate = sample_rate
         self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
         self.p = pyaudio.PyAudio()
+        self.device_rate, self.device_channels = sample_rate, CHANNELS
+        if native:
+            self.device_rate, self.device_channels = native_format(
+                self.p, input_device_index, input=True
+            )
+        self.resampler = None
+        self.block_ms = 0.0
+        self.errors = 0
+        device_frames = frames_per_buffer
+        stream_callback = callback
+        if (self.device_rate, self.device_channels) != (sample_rate, CHANNELS):
+            up = sample_rate // gcd(self.device_rate, sample_rate)
+            self.resampler = Resampler(
+                self.device_rate,
+                sample_rate,
+                in_channels=self.device_channels,
+                periods=max(1, round(frames_per_buffer / up)),
+            )
+            device_frames = self.resampler.in_frames
+            stream_callback = self.device_callback
+            self.blocks = queue.Queue()
+            self.thread = threading.Thread(
+                target=self.worker, name="audio-recorder", daemon=True
+            )
+            self.thread.start()
+            logging.info(
+                f"Recording at {self.device_rate} Hz x{self.device_channels}, "
+                f"resampled to {sample_rate} Hz mono"
+            )
         self.stream = self.p.open(
             input_device_index=input_device_index,
             format=FORMAT,
-            channels=CHANNELS,
-            rate=self.sample_rate,
+            channels=self.device_channels,
+            rate=self.device_rate,
             input=True,
-            frames_per_buffer=self.frames_per_buffer,
-            stream_callback=callback,
+            frames_per_buffer=device_frames,
+            stream_callback=stream_callback,
         )
 
+    def device_callback(self, in_data, _frame_count, time_info, status):
+        self.blocks.put((in_data, time_info, status))
+        return (bytes(), pyaudio.paContinue)
+
+    def worker(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            in_data, time_info, status = block
+            # One bad block must not end capture for the rest of the session
+            try:
+                start = time.perf_counter()
+                data = self.resampler.process(in_data)
+                self.block_ms = (time.perf_counter() - start) * 1000
+                self.callback(data, self.resampler.out_frames, time_info, status)
+            except Exception:
+                self.errors += 1
+                logging.exception("Failed to process a recorded block")
+
+    def metrics(self):
+        """
+        Latency the conversion adds on top of PortAudio's own: the filter's
+        delay plus the blocks waiting for the worker.
+        """
+        latency_ms = 0.0
+        backlog = 0
+        if self.resampler is not None:
+            backlog = self.blocks.qsize()
+            latency_ms = (
+                self.resampler.latency_at(self.device_rate)
+                + backlog * self.resampler.in_frames / self.device_rate
+            ) * 1000
+        return {
+            "device_rate": self.device_rate,
+            "device_channels": self.device_channels,
+            "added_latency_ms": latency_ms,
+            "backlog_blocks": backlog,
+            "block_ms": self.block_ms,
+            "errors": self.errors,
+        }
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.p.terminate()
+        if self.resampler is not None:
+            self.blocks.put(None)
+
 
 class AudioPlayer:
     def __init__(
@@ -34,20 +236,113 @@ class AudioPlayer:
         sample_rate=16000,
         frames_per_buffer=512,
         callback=None,
+        native=True,
+        prebuffer_blocks=2,
     ):
+        """
+        Plays mono PCM16 at `sample_rate`. With `native`, the device is opened
+        at its own rate and channel count and a worker thread pulls audio from
+        the callback and converts it `prebuffer_blocks` ahead of playback.
+        """
         self.sample_rate = sample_rate
         self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
         self.p = pyaudio.PyAudio()
+        self.device_rate, self.device_channels = sample_rate, CHANNELS
+        if native:
+            self.device_rate, self.device_channels = native_format(
+                self.p, output_device_index, input=False
+            )
+        self.resampler = None
+        self.block_ms = 0.0
+        self.underruns = 0
+        self.errors = 0
+        self.closed = False
+        device_frames = frames_per_buffer
+        stream_callback = callback
+        if (self.device_rate, self.device_channels) != (sample_rate, CHANNELS):
+            down = sample_rate // gcd(self.device_rate, sample_rate)
+            self.resampler = Resampler(
+                sample_rate,
+                self.device_rate,
+                out_channels=self.device_channels,
+                periods=max(1, round(frames_per_buffer / down)),
+            )
+            device_frames = self.resampler.out_frames
+            stream_callback = self.device_callback
+            self.silence = bytes(2 * device_frames * self.device_channels)
+            self.blocks = queue.Queue(maxsize=prebuffer_blocks)
+            self.thread = threading.Thread(
+                target=self.worker, name="audio-player", daemon=True
+            )
+            self.thread.start()
+            logging.info(
+                f"Playing at {self.device_rate} Hz x{self.device_channels}, "
+                f"resampled from {sample_rate} Hz mono"
+            )
         self.stream = self.p.open(
             output_device_index=output_device_index,
             format=FORMAT,
-            channels=CHANNELS,
-            rate=self.sample_rate,
+            channels=self.device_channels,
+            rate=self.device_rate,
             output=True,
-            frames_per_buffer=self.frames_per_buffer,
-            stream_callback=callback,
+            frames_per_buffer=device_frames,
+            stream_callback=stream_callback,
         )
 
+    def device_callback(self, _in_data, frame_count, _time_info, _status):
+        try:
+            return (self.blocks.get_nowait(), pyaudio.paContinue)
+        except queue.Empty:
+            self.underruns += 1
+            return (self.silence, pyaudio.paContinue)
+
+    def worker(self):
+        while not self.closed:
+            # One bad block plays as silence instead of ending playback
+            try:
+                data, _ = self.callback(None, self.resampler.in_frames, None, 0)
+                start = time.perf_counter()
+                data = self.resampler.process(data)
+                self.block_ms = (time.perf_counter() - start) * 1000
+            except Exception:
+                self.errors += 1
+                logging.exception("Failed to produce a playback block")
+                data = self.silence
+            # Waits while the prebuffer is full, which paces the worker
+            while not self.closed:
+                try:
+                    self.blocks.put(data, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def metrics(self):
+        """
+        Latency the conversion adds on top of PortAudio's own: the filter's
+        delay plus the prebuffered blocks.
+        """
+        latency_ms = 0.0
+        if self.resampler is not None:
+            latency_ms = (
+                self.resampler.latency_at(self.sample_rate)
+                + self.blocks.maxsize * self.resampler.out_frames / self.device_rate
+            ) * 1000
+        return {
+            "device_rate": self.device_rate,
+            "device_channels": self.device_channels,
+            "added_latency_ms": latency_ms,
+            "underruns": self.underruns,
+            "block_ms": self.block_ms,
+            "errors": self.errors,
+        }
+
+    def close(self):
+        self.closed = True
+        self.stream.stop_stream()
+        self.stream.close()
+        self.p.terminate()
+
 
 async def main():
     def callback(in_data, frame_count, time_info, status):
@@ -0,0 +1,107 @@
+import asyncio
+import base64
+import logging
+import threading
+import time
+
+import websockets
+
+# input_audio_buffer.append with the audio spliced in, instead of a json.dumps
+# of a fresh dict per chunk. Base64 needs no JSON escaping.
+APPEND_TEMPLATE = '{"type":"input_audio_buffer.append","audio":"%s"}'
+
+
+class AudioSender:
+    def __init__(
+        self,
+        websocket,
+        sample_rate=24000,
+        bytes_per_frame=2,
+        chunk_ms=40,
+        max_chunk_ms=200,
+        queue_size=50,
+    ):
+        """
+        Streams captured microphone audio to the Realtime API from a dedicated
+        task, so a slow send never holds up the capture side.
+
+        Audio is cut into chunks of `chunk_ms` on the capture thread and handed
+        to the sender through a bounded queue. When sends fall behind, the
+        chunk size grows towards `max_chunk_ms` to cut per-message overhead,
+        and shrinks back once the queue drains. If the queue is full the oldest
+        chunk is dropped.
+
+        :param websocket: Connected Realtime API websocket.
+        :param sample_rate: Sample rate of the captured audio.
+        :param bytes_per_frame: Bytes per captured frame.
+        :param chunk_ms: Smallest chunk, used while the link keeps up.
+        :param max_chunk_ms: Largest chunk, used while the link is congested.
+        :param queue_size: Chunks that may wait for the sender.
+        """
+        self.websocket = websocket
+        self.bytes_per_ms = sample_rate * bytes_per_frame // 1000
+        self.min_chunk_ms = chunk_ms
+        self.max_chunk_ms = max_chunk_ms
+        self.chunk_ms = chunk_ms
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.loop = asyncio.get_running_loop()
+        self.buffer = bytearray()
+        self.buffer_lock = threading.Lock()
+        self.dropped_chunks = 0
+        self.sent_chunks = 0
+        self.sent_bytes = 0
+        self.last_send_ms = 0.0
+
+    def capture(self, data):
+        """
+        Adds captured audio. Called from the PortAudio thread.
+        """
+        with self.buffer_lock:
+            self.buffer += data
+            chunk_bytes = self.chunk_ms * self.bytes_per_ms
+            if len(self.buffer) < chunk_bytes:
+                return
+            chunk = bytes(self.buffer)
+            self.buffer.clear()
+        try:
+            self.loop.call_soon_threadsafe(self.enqueue, chunk)
+        except RuntimeError:
+            # The event loop is gone, we are shutting down
+            pass
+
+    def enqueue(self, chunk):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped_chunks += 1
+            logging.warning("Audio send queue is full, dropping the oldest chunk")
+        self.queue.put_nowait(chunk)
+
+    async def run(self):
+        while True:
+            chunk = await self.queue.get()
+            start = time.perf_counter()
+            try:
+                await self.websocket.send(
+                    APPEND_TEMPLATE % base64.b64encode(chunk).decode("ascii")
+                )
+            except websockets.exceptions.ConnectionClosed:
+                logging.warning("Connection closed")
+                break
+            self.last_send_ms = (time.perf_counter() - start) * 1000
+            self.sent_chunks += 1
+            self.sent_bytes += len(chunk)
+
+            if self.queue.qsize() > 1:
+                self.chunk_ms = min(self.max_chunk_ms, self.chunk_ms * 2)
+            elif self.queue.empty():
+                self.chunk_ms = max(self.min_chunk_ms, self.chunk_ms - 10)
+
+    def metrics(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "dropped_chunks": self.dropped_chunks,
+            "sent_chunks": self.sent_chunks,
+            "sent_bytes": self.sent_bytes,
+            "chunk_ms": self.chunk_ms,
+            "last_send_ms": self.last_send_ms,
+        }
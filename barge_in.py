@@ -0,0 +1,105 @@
+import time
+
+import numpy as np
+
+
+def rms(data):
+    samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+    if len(samples) == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(samples**2)))
+
+
+class BargeInGate:
+    """
+    Decides whether mic audio is passed on while the robot is talking, in half
+    duplex where there is no echo canceller.
+
+    The mic hears the robot's own voice from the speaker, so an absolute level
+    would let it through and the robot would interrupt itself. The gate opens
+    only for input clearly louder than the echo expected from what was just
+    played: the recent playback level times the speaker-to-mic coupling. The
+    coupling is learned from the mic during playback, rising quickly to the
+    actual leakage and falling slowly, so speech over the robot does not
+    inflate it.
+    """
+
+    HISTORY = 64
+
+    def __init__(
+        self,
+        threshold_db=-30.0,
+        hold_ms=1000,
+        margin_db=10.0,
+        echo_ms=500,
+        coupling_db=0.0,
+    ):
+        """
+        :param threshold_db: Level in dB full scale input must exceed regardless
+            of playback.
+        :param hold_ms: How long the gate stays open once opened.
+        :param margin_db: How much louder than the expected echo input must be.
+        :param echo_ms: How far back played audio can still be heard, covering
+            output latency and the room's reverberation.
+        :param coupling_db: Initial speaker-to-mic coupling, high on purpose
+            until the actual one has been learned.
+        """
+        self.threshold = 32768 * 10 ** (threshold_db / 20)
+        self.hold = hold_ms / 1000
+        self.margin = 10 ** (margin_db / 20)
+        self.echo_window = echo_ms / 1000
+        self.coupling_db = coupling_db
+        # Levels of recently played frames, written by the output callback
+        self.played_at = np.full(self.HISTORY, -np.inf)
+        self.played_level = np.zeros(self.HISTORY)
+        self.played_index = 0
+        self.until = 0.0
+        self.openings = 0
+
+    def playback(self, frame, now=None):
+        """
+        Notes a frame handed to the output stream, silence included.
+        """
+        index = self.played_index
+        self.played_level[index] = rms(frame)
+        self.played_at[index] = time.monotonic() if now is None else now
+        self.played_index = (index + 1) % self.HISTORY
+
+    def echo_level(self, now):
+        recent = self.played_at >= now - self.echo_window
+        if not recent.any():
+            return 0.0
+        return float(self.played_level[recent].max())
+
+    def passes(self, data, playing, now=None):
+        """
+        Returns whether captured mic audio should be sent.
+
+        :param data: PCM16 mono bytes.
+        :param playing: Whether the robot is talking.
+        """
+        if not playing:
+            return True
+        now = time.monotonic() if now is None else now
+        if now < self.until:
+            return True
+
+        level = rms(data)
+        echo = self.echo_level(now)
+        expected = echo * 10 ** (self.coupling_db / 20)
+        if level > max(self.threshold, expected * self.margin):
+            self.until = now + self.hold
+            self.openings += 1
+            return True
+
+        if echo > 0 and level > 0:
+            ratio_db = 20 * np.log10(level / echo)
+            rate = 0.2 if ratio_db > self.coupling_db else 0.02
+            self.coupling_db += rate * (ratio_db - self.coupling_db)
+        return False
+
+    def close(self):
+        self.until = 0.0
+
+    def metrics(self):
+        return {"openings": self.openings, "coupling_db": self.coupling_db}
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import time
+
+import cv2
+
+from frames import FrameSource
+
+CAPTURE_BACKENDS = {
+    "any": cv2.CAP_ANY,
+    "v4l2": cv2.CAP_V4L2,
+}
+
+DEFAULT_CAMERA = {
+    "name": "front",
+    "device": 0,
+    "fourcc": "MJPG",
+    "width": 1280,
+    "height": 720,
+    "fps": 30,
+    "buffer_size": 1,
+    "backend": "v4l2",
+    "consumers": [],
+}
+
+
+def decode_fourcc(value):
+    value = int(value)
+    return "".join(chr((value >> (8 * i)) & 0xFF) for i in range(4))
+
+
+class Camera:
+    def __init__(
+        self,
+        name,
+        device=0,
+        fourcc="MJPG",
+        width=1280,
+        height=720,
+        fps=30,
+        buffer_size=1,
+        backend="v4l2",
+        consumers=(),
+    ):
+        """
+        Opens a camera with explicit capture settings and shares its frames
+        through a FrameSource.
+
+        Without them many USB webcams fall back to uncompressed YUYV, which
+        USB 2 bandwidth limits to a few frames per second at 720p. What the
+        driver actually negotiated is read back and reported.
+
+        :param name: Name used in logs and metrics.
+        :param device: Device index, or a path such as /dev/v4l/by-id/..., which
+            stays stable when several cameras are plugged in.
+        :param fourcc: Pixel format to request, e.g. "MJPG" or "YUYV".
+        :param width: Frame width to request.
+        :param height: Frame height to request.
+        :param fps: Frame rate to request.
+        :param buffer_size: Frames the driver may queue, 1 keeps frames fresh.
+        :param backend: "v4l2" or "any".
+        :param consumers: Names of the consumers reading from this camera.
+        """
+        self.name = name
+        self.device = device
+        self.consumers = list(consumers)
+        self.requested = {
+            "fourcc": fourcc,
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "buffer_size": buffer_size,
+        }
+        stream = cv2.VideoCapture(device, CAPTURE_BACKENDS[backend])
+        # The pixel format has to be set before the size, V4L2 picks the
+        # sizes and rates it offers per format
+        if fourcc:
+            stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        stream.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        stream.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        stream.set(cv2.CAP_PROP_FPS, fps)
+        stream.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        self.negotiated = {
+            "fourcc": decode_fourcc(stream.get(cv2.CAP_PROP_FOURCC)),
+            "width": int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": stream.get(cv2.CAP_PROP_FPS),
+            "buffer_size": int(stream.get(cv2.CAP_PROP_BUFFERSIZE)),
+        }
+        if not stream.isOpened():
+            logging.error(f"Camera {name} ({device}) could not be opened")
+        else:
+            logging.info(f"Camera {name} ({device}) negotiated {self.negotiated}")
+            mismatched = {
+                key: (value, self.negotiated[key])
+                for key, value in self.requested.items()
+                if value and value != self.negotiated[key]
+            }
+            if mismatched:
+                logging.warning(
+                    f"Camera {name} did not accept (requested, got): {mismatched}"
+                )
+        self.frames = FrameSource(stream)
+        self.last_count = 0
+        self.last_count_at = None
+
+    def metrics(self, now):
+        measured_fps = 0.0
+        count = self.frames.frames_captured
+        if self.last_count_at is not None and now > self.last_count_at:
+            measured_fps = (count - self.last_count) / (now - self.last_count_at)
+        self.last_count, self.last_count_at = count, now
+        return {
+            **{f"negotiated_{key}": value for key, value in self.negotiated.items()},
+            "frames_captured": count,
+            "measured_fps": measured_fps,
+        }
+
+    def release(self):
+        self.frames.release()
+
+
+class Cameras:
+    """
+    The robot's cameras and which consumer reads from which, e.g. a close-up
+    face camera for heart rate and a wide one for pose. Consumers that no
+    camera lists read from the first camera.
+    """
+
+    def __init__(self, configs):
+        """
+        :param configs: List of Camera keyword arguments.
+        """
+        self.cameras = [Camera(**config) for config in configs]
+        self.routes = {}
+        for camera in self.cameras:
+            for consumer in camera.consumers:
+                self.routes[consumer] = camera
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads the camera list from a JSON file, or uses a single default
+        camera if there is none.
+        """
+        if not os.path.exists(path):
+            logging.info(f"No camera config at {path}, using the default camera")
+            return cls([DEFAULT_CAMERA])
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def source_for(self, consumer):
+        """
+        Returns the FrameSource a consumer should read from.
+        """
+        return self.routes.get(consumer, self.cameras[0]).frames
+
+    def metrics(self):
+        now = time.monotonic()
+        return {
+            f"{camera.name}_{key}": value
+            for camera in self.cameras
+            for key, value in camera.metrics(now).items()
+        }
+
+    def release(self):
+        for camera in self.cameras:
+            camera.release()
@@ -2,6 +2,7 @@ from aiohttp import web
 from gpiozero import PhaseEnableMotor
 import asyncio
 import pose_estimate
+from metrics import registry
 import os
 from dotenv import load_dotenv
 
@@ -14,8 +15,12 @@ class ControlServer:
     # HTML content for the webpage (from "index.html")
     HTML = open("index.html", "r").read()
 
-    def __init__(self, pose_estimator: pose_estimate.PoseEstimator) -> None:
+    def __init__(
+        self, pose_estimator: pose_estimate.PoseEstimator, recorder=None
+    ) -> None:
         self.autonomous = False
+        self.recorder = recorder
+        self.scheduler = pose_estimator.scheduler
         if REAL_ROBOT:
             self.lf_motor = PhaseEnableMotor(7, 8)
             self.rf_motor = PhaseEnableMotor(6, 13)
@@ -45,6 +50,15 @@ class ControlServer:
         return web.Response(text=self.HTML, content_type="text/html")
 
     def control(self, velocity, steering):
+        if self.recorder is not None:
+            self.recorder.record(
+                "motor",
+                {
+                    "velocity": velocity,
+                    "steering": steering,
+                    "autonomous": self.autonomous,
+                },
+            )
         left_throttle = velocity + steering
         right_throttle = velocity - steering
 
@@ -125,8 +139,13 @@ class ControlServer:
         print(request)
         request = await request.json()
         self.autonomous = request.get("autonomous", False)
+        # The follow controller needs pose at full rate
+        self.scheduler.set_autonomous(self.autonomous)
         return web.Response(text="Autonomous mode updated")
 
+    async def handle_metrics(self, _):
+        return web.json_response(registry.collect())
+
     # Main function to set up the server
     async def run_server(self):
         app = web.Application()
@@ -134,6 +153,7 @@ class ControlServer:
         app.router.add_post("/input", self.handle_input)
         app.router.add_post("/abort", self.handle_abort)
         app.router.add_post("/autonomous", self.handle_autonomous)
+        app.router.add_get("/metrics", self.handle_metrics)
 
         runner = web.AppRunner(app)
         await runner.setup()
@@ -152,8 +172,10 @@ async def main():
 
     FORMAT = "%(message)s"
     logging.basicConfig(level="INFO", format=FORMAT, datefmt="[%X]")
-    stream = cv2.VideoCapture(0)
-    pose_estimator = pose_estimate.PoseEstimator(stream)
+    from frames import FrameSource
+
+    frames = FrameSource(cv2.VideoCapture(0))
+    pose_estimator = pose_estimate.PoseEstimator(frames)
     control_server = ControlServer(pose_estimator)
     server_task = asyncio.create_task(control_server.run_server())
 
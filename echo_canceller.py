@@ -0,0 +1,179 @@
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class EchoCanceller:
+    """
+    Removes the robot's own voice from the microphone signal so the mic can
+    stay open while it talks.
+
+    A partitioned block frequency-domain adaptive filter (overlap-save, NLMS
+    update per frequency bin) models the path from the speaker to the mic,
+    using the audio handed to the output stream as reference, and subtracts
+    its estimate of the echo. Filtering runs on a worker thread; PortAudio's
+    callbacks only copy bytes.
+    """
+
+    def __init__(
+        self,
+        sink,
+        block_size=256,
+        partitions=8,
+        step_size=0.1,
+        max_reference_ms=500,
+        sample_rate=24000,
+    ):
+        """
+        :param sink: Called with the cleaned PCM16 bytes, on the worker thread.
+        :param block_size: Samples filtered at a time.
+        :param partitions: Filter length in blocks, it has to cover the
+            output and input latency plus the room's echo tail.
+        :param step_size: NLMS step size, lower adapts slower but drifts less
+            while both people talk.
+        :param max_reference_ms: Reference audio kept ahead of the mic before
+            the oldest is dropped, bounds drift between the two streams.
+        :param sample_rate: Sample rate of both streams.
+        """
+        self.sink = sink
+        self.block_size = block_size
+        self.partitions = partitions
+        self.step_size = step_size
+        self.max_reference = max_reference_ms * sample_rate // 1000
+        bins = block_size + 1
+        self.weights = np.zeros((partitions, bins), dtype=np.complex64)
+        # Spectra of the last `partitions` reference blocks, newest first
+        self.reference_spectra = np.zeros((partitions, bins), dtype=np.complex64)
+        self.reference_power = np.full(bins, 1e-3, dtype=np.float32)
+        self.previous_reference = np.zeros(block_size, dtype=np.float32)
+        self.window = np.zeros(2 * block_size, dtype=np.float32)
+        self.padded_error = np.zeros(2 * block_size, dtype=np.float32)
+        # Smoothed error to mic energy ratio of the blocks adapted on
+        self.residual = 1.0
+
+        self.mic = bytearray()
+        self.reference = bytearray()
+        self.reference_lock = threading.Lock()
+        self.blocks = queue.Queue()
+        self.mic_energy = 0.0
+        self.error_energy = 0.0
+        self.dropped_reference = 0
+        self.block_ms = 0.0
+        self.thread = threading.Thread(
+            target=self.worker, name="echo-canceller", daemon=True
+        )
+        self.thread.start()
+
+    def add_reference(self, data):
+        """
+        Adds audio that was just handed to the output stream. Called from the
+        PortAudio output thread, also with the silence played between responses
+        so the reference keeps pace with the mic.
+        """
+        with self.reference_lock:
+            self.reference += data
+            excess = len(self.reference) - 2 * self.max_reference
+            if excess > 0:
+                del self.reference[:excess]
+                self.dropped_reference += excess // 2
+
+    def add_capture(self, data):
+        """
+        Adds captured mic audio. Called from the PortAudio input thread.
+        """
+        self.mic += data
+        block_bytes = 2 * self.block_size
+        while len(self.mic) >= block_bytes:
+            self.blocks.put(bytes(self.mic[:block_bytes]))
+            del self.mic[:block_bytes]
+
+    def next_reference(self):
+        block_bytes = 2 * self.block_size
+        with self.reference_lock:
+            data = bytes(self.reference[:block_bytes])
+            del self.reference[:block_bytes]
+        if len(data) < block_bytes:
+            data += bytes(block_bytes - len(data))
+        return np.frombuffer(data, dtype=np.int16).astype(np.float32)
+
+    def worker(self):
+        while True:
+            data = self.blocks.get()
+            if data is None:
+                break
+            start = time.perf_counter()
+            mic = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+            cleaned = self.process(mic, self.next_reference())
+            self.block_ms = (time.perf_counter() - start) * 1000
+            try:
+                self.sink(np.clip(cleaned, -32768, 32767).astype(np.int16).tobytes())
+            except Exception:
+                logging.exception("Echo canceller sink failed")
+
+    def process(self, mic, reference):
+        """
+        Filters one block and returns the mic signal with the estimated echo
+        removed.
+        """
+        n = self.block_size
+        self.window[:n] = self.previous_reference
+        self.window[n:] = reference
+        self.previous_reference[:] = reference
+        self.reference_spectra = np.roll(self.reference_spectra, 1, axis=0)
+        self.reference_spectra[0] = np.fft.rfft(self.window)
+
+        if not reference.any():
+            # Nothing is playing, so there is no echo to remove
+            self.mic_energy = self.error_energy = float(np.dot(mic, mic))
+            return mic
+
+        self.reference_power = 0.9 * self.reference_power + 0.1 * np.abs(
+            self.reference_spectra[0]
+        ) ** 2
+        echo = np.fft.irfft((self.weights * self.reference_spectra).sum(axis=0))[n:]
+        error = mic - echo
+        self.mic_energy = float(np.dot(mic, mic))
+        self.error_energy = float(np.dot(error, error))
+        if self.error_energy > self.mic_energy:
+            # Diverged, e.g. the echo path changed: start over rather than add noise
+            self.weights[:] = 0
+            self.residual = 1.0
+            return mic
+
+        ratio = self.error_energy / max(self.mic_energy, 1e-9)
+        if ratio > max(4 * self.residual, 0.01):
+            # Much more left than the filter usually leaves: the farmer is
+            # talking too. Adapting now would cancel their voice, so hold the
+            # filter, but not forever in case the echo path changed
+            self.residual *= 1.03
+            return error
+        self.residual = 0.95 * self.residual + 0.05 * ratio
+
+        self.padded_error[n:] = error
+        error_spectrum = np.fft.rfft(self.padded_error)
+        gradient = (
+            np.conj(self.reference_spectra) * error_spectrum / self.reference_power
+        )
+        # Constrain the gradient to a linear convolution of block_size taps
+        gradient = np.fft.irfft(gradient, axis=1)
+        gradient[:, n:] = 0
+        self.weights += self.step_size * np.fft.rfft(gradient, axis=1)
+        return error
+
+    def metrics(self):
+        erle = 0.0
+        if self.error_energy > 0 and self.mic_energy > 0:
+            erle = 10 * np.log10(self.mic_energy / self.error_energy)
+        return {
+            "erle_db": float(erle),
+            "block_ms": self.block_ms,
+            "backlog_blocks": self.blocks.qsize(),
+            "dropped_reference_samples": self.dropped_reference,
+        }
+
+    def close(self):
+        self.blocks.put(None)
+        self.thread.join(timeout=1)
@@ -4,6 +4,10 @@
 #define BAT_PIN 0
 #define DHT_PIN 1
 
+// Responses are single lines of the form "KIND key=value key=value", see
+// telemetry.py on the host side.
+#define BAUD_RATE 115200
+
 #include <DHT11.h>
 
 DHT11 dht11(DHT_PIN);
@@ -28,7 +32,6 @@ float batteryCapacity(int analogVal)
     {
         if (voltageTable[i] < vBat)
         {
-            Serial.println(i);
             if (i == 0)
                 return 100.0;
             else
@@ -44,7 +47,7 @@ float batteryCapacity(int analogVal)
 
 void setup()
 {
-    Serial.begin(9600);
+    Serial.begin(BAUD_RATE);
 }
 
 void loop()
@@ -61,39 +64,39 @@ void loop()
         switch ((char)requestByte)
         {
         case REQ_BAT: // '0'
-            Serial.println("Battery request detected");
+        {
             val = analogRead(BAT_PIN);
-            float capacity;
-            capacity = batteryCapacity(val);
-            Serial.println("battery");
-            Serial.println(val);
+            float capacity = batteryCapacity(val);
+            Serial.print("BAT raw=");
+            Serial.print(val);
+            Serial.print(" cap=");
             Serial.println(capacity);
             break;
+        }
 
         case REQ_DHT: // '1'
-            Serial.println("Humidity request detected");
+        {
             int err;
             float temp, humi;
             if ((err = dht11.read(humi, temp)) == 0)
             {
-                Serial.print("temperature:");
+                Serial.print("DHT temp=");
                 Serial.print(temp);
-                Serial.print(" humidity:");
-                Serial.print(humi);
-                Serial.println();
+                Serial.print(" hum=");
+                Serial.println(humi);
             }
             else
             {
-                Serial.println();
-                Serial.print("Error No :");
-                Serial.print(err);
-                Serial.println();
+                Serial.print("DHT err=");
+                Serial.println(err);
             }
             delay(DHT11_RETRY_DELAY); // delay for reread
             break;
+        }
 
         default:
-            Serial.println("Default case triggered: Invalid request");
+            Serial.print("ERR req=");
+            Serial.println(requestByte);
             break;
         }
     }
@@ -0,0 +1,286 @@
+import asyncio
+import inspect
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class ScreamDetector:
+    def __init__(
+        self,
+        sample_rate=24000,
+        frame_ms=20,
+        loud_dbfs=-15.0,
+        band=(800, 4000),
+        band_ratio=0.6,
+        min_duration_ms=240,
+        playback_margin_db=10.0,
+    ):
+        """
+        Cheap detector for screams and shouts on PCM16 mono audio: a run of
+        loud frames whose energy sits mostly in the band a raised voice puts
+        it in. Frames are analyzed in one batch per chunk.
+
+        :param sample_rate: Sample rate of the audio.
+        :param frame_ms: Analysis frame length.
+        :param loud_dbfs: RMS level a frame must exceed, in dB full scale.
+        :param band: Frequency band in Hz a scream's energy is mostly in.
+        :param band_ratio: Share of a frame's energy that must be in `band`.
+        :param min_duration_ms: Loud frames needed in a row to fire.
+        :param playback_margin_db: Extra level required while the robot is
+            talking, the mic hears its speaker too.
+        """
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.loud_dbfs = loud_dbfs
+        self.band_ratio = band_ratio
+        self.min_frames = max(1, min_duration_ms // frame_ms)
+        self.playback_margin_db = playback_margin_db
+        freqs = np.fft.rfftfreq(self.frame_size, d=1 / sample_rate)
+        self.band = (freqs >= band[0]) & (freqs <= band[1])
+        self.window = np.hanning(self.frame_size).astype(np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.run = 0
+        self.run_started_at = None
+
+    def feed(self, data, captured_at, playing=False):
+        """
+        Analyzes a chunk of audio.
+
+        :param data: PCM16 mono bytes.
+        :param captured_at: Wall clock time the chunk's last sample was captured.
+        :param playing: Whether the robot was talking during the chunk.
+        :return: Capture time of the scream's first frame when one was just
+            detected, else None.
+        """
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768
+        if len(self.pending):
+            samples = np.concatenate([self.pending, samples])
+        count = len(samples) // self.frame_size
+        self.pending = samples[count * self.frame_size :]
+        if count == 0:
+            return None
+
+        frames = samples[: count * self.frame_size].reshape(count, self.frame_size)
+        rms = np.sqrt(np.mean(frames**2, axis=1))
+        dbfs = 20 * np.log10(np.maximum(rms, 1e-9))
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2
+        ratio = power[:, self.band].sum(axis=1) / np.maximum(power.sum(axis=1), 1e-12)
+        threshold = self.loud_dbfs + (self.playback_margin_db if playing else 0.0)
+        loud = (dbfs > threshold) & (ratio > self.band_ratio)
+
+        # End time of each frame, the pending tail is the newest audio
+        frame_ends = captured_at - (
+            len(self.pending) + (count - 1 - np.arange(count)) * self.frame_size
+        ) / self.sample_rate
+        frame_duration = self.frame_size / self.sample_rate
+        detected_at = None
+        for i in range(count):
+            if not loud[i]:
+                self.run = 0
+                continue
+            if self.run == 0:
+                self.run_started_at = float(frame_ends[i] - frame_duration)
+            self.run += 1
+            if self.run == self.min_frames:
+                detected_at = self.run_started_at
+        return detected_at
+
+
+class EmergencyMonitor:
+    """
+    Raises alerts for screams and falls on the robot itself, without waiting
+    for the Realtime API to notice them.
+
+    Audio is analyzed on a worker thread, so capture callbacks only queue it.
+    Alert hooks are called as soon as an event is detected. Latency is
+    measured from the event to the hooks being called, i.e. from the first
+    frame of a scream and from the frame a fall's drop was seen in, and
+    tracked against a budget.
+    """
+
+    def __init__(
+        self,
+        detector=None,
+        budget_ms=500,
+        cooldown=30,
+        correlation_window=10,
+    ):
+        """
+        :param detector: ScreamDetector for the capture stream.
+        :param budget_ms: Latency an alert should stay within, misses are logged.
+        :param cooldown: Seconds before the same kind of alert fires again.
+        :param correlation_window: A scream and a fall this many seconds
+            apart confirm each other.
+        """
+        self.detector = detector or ScreamDetector()
+        self.budget_ms = budget_ms
+        self.cooldown = cooldown
+        self.correlation_window = correlation_window
+        self.hooks = []
+        self.loop = None
+        self.last_event = {}  # kind -> detection time
+        self.last_alert = {}  # kind -> alert time
+        self.alerts = 0
+        self.budget_misses = 0
+        self.latencies = deque(maxlen=100)
+        self.audio = queue.Queue()
+        self.thread = threading.Thread(
+            target=self.audio_loop, name="emergency-audio", daemon=True
+        )
+        self.thread.start()
+
+    def add_hook(self, hook):
+        """
+        Adds a callable taking the alert dict. Coroutine functions are run on
+        the event loop that was running when they were added.
+        """
+        if self.is_coroutine_hook(hook):
+            self.loop = asyncio.get_running_loop()
+        self.hooks.append(hook)
+
+    def feed_audio(self, data, captured_at=None, playing=False):
+        """
+        Queues captured PCM16 mono audio. Safe to call from audio callbacks.
+        """
+        self.audio.put((data, captured_at or time.time(), playing))
+
+    def audio_loop(self):
+        while True:
+            item = self.audio.get()
+            if item is None:
+                break
+            data, captured_at, playing = item
+            detected_at = self.detector.feed(data, captured_at, playing)
+            if detected_at is not None:
+                self.report("scream", detected_at)
+
+    def report_fall(self, detected_at):
+        """
+        Reports a suspected fall whose drop was seen on the frame captured at
+        `detected_at`. The alert does not wait for the farmer to lie still,
+        that alone takes longer than the budget.
+        """
+        self.report("fall", detected_at)
+
+    def report(self, kind, detected_at):
+        now = time.time()
+        self.last_event[kind] = detected_at
+        last = self.last_alert.get(kind)
+        if last is not None and now - last < self.cooldown:
+            return
+        self.last_alert[kind] = now
+
+        other = "fall" if kind == "scream" else "scream"
+        confirmed = bool(
+            other in self.last_event
+            and abs(detected_at - self.last_event[other]) <= self.correlation_window
+        )
+        latency_ms = (now - detected_at) * 1000
+        alert = {
+            "kind": kind,
+            "confirmed": confirmed,
+            "detected_at": detected_at,
+            "latency_ms": latency_ms,
+        }
+        self.alerts += 1
+        self.latencies.append(latency_ms)
+        if latency_ms > self.budget_ms:
+            self.budget_misses += 1
+            logging.warning(
+                f"Emergency alert took {latency_ms:.0f} ms, over the "
+                f"{self.budget_ms} ms budget"
+            )
+        logging.critical(f"Emergency: {alert}")
+        for hook in self.hooks:
+            try:
+                if self.is_coroutine_hook(hook):
+                    future = asyncio.run_coroutine_threadsafe(hook(alert), self.loop)
+                    future.add_done_callback(self.hook_done)
+                else:
+                    hook(alert)
+            except Exception:
+                logging.exception("Emergency hook failed")
+
+    @staticmethod
+    def is_coroutine_hook(hook):
+        return inspect.iscoroutinefunction(hook) or inspect.iscoroutinefunction(
+            getattr(hook, "__call__", None)
+        )
+
+    @staticmethod
+    def hook_done(future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.error("Emergency hook failed", exc_info=future.exception())
+
+    def metrics(self):
+        latencies = np.array(self.latencies or [0.0])
+        return {
+            "alerts": self.alerts,
+            "budget_misses": self.budget_misses,
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_max": float(latencies.max()),
+            "audio_backlog": self.audio.qsize(),
+        }
+
+    def close(self):
+        self.audio.put(None)
+        self.thread.join(timeout=1)
+
+
+class AlertRelay:
+    """
+    Alert hook passing alerts on to the current chat session.
+
+    Alerts raised while there is no session, e.g. while reconnecting, or
+    that fail to send are held and sent when the next session is attached.
+    Only the latest of them is sent, each alert asks for a response and
+    they would collide.
+    """
+
+    def __init__(self, max_age=300):
+        """
+        :param max_age: Seconds after which a held alert is no longer sent.
+        """
+        self.max_age = max_age
+        self.send = None
+        self.held = []
+
+    async def __call__(self, alert):
+        if self.send is None:
+            logging.warning("No chat session, holding the emergency alert")
+            self.held.append(alert)
+            return
+        try:
+            await self.send(alert)
+        except Exception:
+            self.held.append(alert)
+            raise
+
+    async def attach(self, send):
+        """
+        Sends alerts to `send`, a coroutine function taking the alert, and
+        sends it the latest held alert.
+        """
+        self.send = send
+        held, self.held = self.held, []
+        fresh = [
+            alert for alert in held if time.time() - alert["detected_at"] < self.max_age
+        ]
+        if len(fresh) < len(held):
+            logging.warning(f"Dropped {len(held) - len(fresh)} stale emergency alerts")
+        if not fresh:
+            return
+        latest = dict(fresh[-1])
+        latest["confirmed"] = any(alert["confirmed"] for alert in fresh)
+        try:
+            await self(latest)
+        except Exception:
+            logging.exception("Failed to send a held emergency alert")
+
+    def detach(self):
+        self.send = None
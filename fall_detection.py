@@ -0,0 +1,220 @@
+import numpy as np
+
+# MediaPipe Pose landmark indices
+NUM_LANDMARKS = 33
+NOSE = 0
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_HIP = 23
+RIGHT_HIP = 24
+
+
+def landmarks_to_array(landmarks, out=None):
+    """
+    Converts MediaPipe pose landmarks to a (33, 4) float32 array of
+    x, y, z and visibility.
+
+    :param landmarks: NormalizedLandmarkList or LandmarkList from MediaPipe.
+    :param out: Optional preallocated array to write into.
+    """
+    if out is None:
+        out = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+    for i, landmark in enumerate(landmarks.landmark):
+        out[i] = (landmark.x, landmark.y, landmark.z, landmark.visibility)
+    return out
+
+
+class LandmarkHistory:
+    def __init__(self, capacity=90):
+        """
+        Ring buffer of the last `capacity` pose landmark arrays with timestamps,
+        preallocated so appending does not allocate.
+
+        :param capacity: Number of frames kept, a few seconds at the pose rate.
+        """
+        self.capacity = capacity
+        self.landmarks = np.zeros((capacity, NUM_LANDMARKS, 4), dtype=np.float32)
+        self.timestamps = np.zeros(capacity)
+        self.count = 0
+        self.index = 0
+
+    def append(self, landmarks, timestamp):
+        """
+        Stores one frame's landmarks, either MediaPipe landmarks or a (33, 4)
+        array, and returns the stored array.
+        """
+        slot = self.landmarks[self.index]
+        if isinstance(landmarks, np.ndarray):
+            slot[:] = landmarks
+        else:
+            landmarks_to_array(landmarks, out=slot)
+        self.timestamps[self.index] = timestamp
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return slot
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        return self.landmarks[self.index - 1]
+
+    def window(self, seconds):
+        """
+        Returns (timestamps, landmarks) of the frames within `seconds` of the
+        latest one, oldest first.
+        """
+        order = np.arange(self.index - self.count, self.index) % self.capacity
+        timestamps = self.timestamps[order]
+        if self.count:
+            order = order[timestamps >= timestamps[-1] - seconds]
+        return self.timestamps[order], self.landmarks[order]
+
+    def clear(self):
+        self.count = 0
+        self.index = 0
+
+
+class FallDetector:
+    """
+    Detects falls from the recent landmark history instead of a single frame.
+
+    A fall is a fast drop of the torso that ends with it near horizontal,
+    followed by the body staying still. Bending over to pick strawberries
+    tilts the torso too, but slowly and with the hips staying up, so it does
+    not pass the velocity check.
+    """
+
+    # Seconds velocities are measured over, the pose rate changes with the
+    # scheduler's context so a fixed number of frames would not do
+    VELOCITY_WINDOW = 0.2
+
+    def __init__(
+        self,
+        drop_velocity=1.5,
+        lying_angle=55.0,
+        upright_angle=30.0,
+        stillness=0.05,
+        drop_window=1.0,
+        still_time=1.0,
+    ):
+        """
+        :param drop_velocity: Downward hip speed that counts as a drop, in torso lengths per second.
+        :param lying_angle: Torso angle from vertical (degrees) that counts as lying.
+        :param upright_angle: Torso angle below which the farmer is up again.
+        :param stillness: Maximum landmark movement after the drop, in torso lengths.
+        :param drop_window: Seconds of history searched for the drop.
+        :param still_time: Seconds the farmer must stay still to confirm a fall.
+        """
+        self.drop_velocity = drop_velocity
+        self.lying_angle = lying_angle
+        self.upright_angle = upright_angle
+        self.stillness = stillness
+        self.drop_window = drop_window
+        self.still_time = still_time
+        self.suspected_at = None
+        self.fall_detected = False
+
+    def torso(self, landmarks, aspect):
+        """
+        Returns shoulder centers, hip centers and torso angles in degrees from
+        vertical for an (n, 33, 4) landmark array, with x scaled by `aspect`
+        (width / height) so angles are in square pixels.
+        """
+        scale = np.array([aspect, 1.0], dtype=np.float32)
+        shoulders = landmarks[:, [LEFT_SHOULDER, RIGHT_SHOULDER], :2].mean(axis=1)
+        hips = landmarks[:, [LEFT_HIP, RIGHT_HIP], :2].mean(axis=1)
+        shoulders = shoulders * scale
+        hips = hips * scale
+        # Image y grows downwards, so an upright torso points to negative y
+        dx, dy = (shoulders - hips).T
+        angles = np.degrees(np.arctan2(np.abs(dx), -dy))
+        return shoulders, hips, angles
+
+    def update(self, history, aspect=1.0):
+        """
+        Evaluates the latest frame of the history.
+
+        :param history: LandmarkHistory with the latest frame appended.
+        :param aspect: Width / height of the frames the landmarks were found in.
+        :return: (fall_detected, suspected) where suspected means a drop was
+            seen and the fall is waiting for confirmation.
+        """
+        timestamps, landmarks = history.window(self.drop_window + self.still_time)
+        if len(timestamps) < 3:
+            return self.fall_detected, self.suspected_at is not None
+
+        shoulders, hips, angles = self.torso(landmarks, aspect)
+        torso_length = np.median(np.linalg.norm(shoulders - hips, axis=1))
+        if torso_length <= 0:
+            return self.fall_detected, self.suspected_at is not None
+
+        now = timestamps[-1]
+        if self.fall_detected:
+            if angles[-1] < self.upright_angle:
+                self.fall_detected = False
+            return self.fall_detected, False
+
+        if self.suspected_at is None:
+            # Velocities over a short time window, single frame differences
+            # are too noisy. Each frame is compared with the oldest frame
+            # within VELOCITY_WINDOW of it, or the previous one at low rates
+            times = timestamps[timestamps >= now - self.drop_window]
+            heights = hips[-len(times) :, 1]
+            earlier = np.searchsorted(times, times - self.VELOCITY_WINDOW)
+            earlier = np.minimum(earlier, np.arange(len(times)) - 1)[1:]
+            dt = times[1:] - times[earlier]
+            dy = heights[1:] - heights[earlier]
+            velocities = np.divide(
+                dy, dt * torso_length, out=np.zeros_like(dy), where=dt > 0
+            )
+            if (
+                len(velocities)
+                and velocities.max() > self.drop_velocity
+                and angles[-1] > self.lying_angle
+            ):
+                self.suspected_at = now
+            return False, self.suspected_at is not None
+
+        if angles[-1] < self.upright_angle:
+            # Got up again before the fall was confirmed
+            self.suspected_at = None
+            return False, False
+
+        if now - self.suspected_at >= self.still_time:
+            still = timestamps >= now - self.still_time
+            points = np.concatenate([shoulders[still], hips[still]], axis=1)
+            movement = points.std(axis=0).max() / torso_length
+            if movement < self.stillness:
+                self.fall_detected = True
+                self.suspected_at = None
+            elif now - self.suspected_at > self.still_time + self.drop_window:
+                # Kept moving after the drop, e.g. sat down and carried on working
+                self.suspected_at = None
+        return self.fall_detected, self.suspected_at is not None
+
+
+def pack_pose_record(landmarks, width, height, fall_detected, fall_suspected):
+    """
+    Packs one frame's pose result for the session recorder: the (33, 4)
+    landmarks plus a row of frame width, height and the fall state.
+    """
+    record = np.empty((NUM_LANDMARKS + 1, 4), dtype=np.float32)
+    record[:NUM_LANDMARKS] = landmarks
+    record[NUM_LANDMARKS] = (width, height, fall_detected, fall_suspected)
+    return record.tobytes()
+
+
+def unpack_pose_record(payload):
+    """
+    Returns (landmarks, width, height, fall_detected, fall_suspected) from a
+    recorded pose result.
+    """
+    record = np.frombuffer(payload, dtype=np.float32).reshape(NUM_LANDMARKS + 1, 4)
+    width, height, fall_detected, fall_suspected = record[NUM_LANDMARKS]
+    return (
+        record[:NUM_LANDMARKS],
+        int(width),
+        int(height),
+        bool(fall_detected),
+        bool(fall_suspected),
+    )
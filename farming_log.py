@@ -0,0 +1,535 @@
+import asyncio
+import heapq
+import logging
+import math
+import queue
+import re
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+WORD = re.compile(r"[가-힣]+|[a-z0-9]+")
+HANGUL = re.compile(r"[가-힣]+")
+# Particles stripped from the end of a Korean word before indexing, longest first
+PARTICLES = sorted(
+    [
+        "은",
+        "는",
+        "이",
+        "가",
+        "을",
+        "를",
+        "에",
+        "에서",
+        "에게",
+        "한테",
+        "로",
+        "으로",
+        "와",
+        "과",
+        "도",
+        "만",
+        "의",
+        "랑",
+        "이랑",
+        "하고",
+        "까지",
+        "부터",
+        "보다",
+    ],
+    key=len,
+    reverse=True,
+)
+
+
+def tokenize(text):
+    """
+    Splits text into search terms.
+
+    Korean words are indexed as character bigrams after stripping a trailing
+    particle, so "딸기에" and "딸기를" both match a search for "딸기" without a
+    morphological analyzer. Latin words and numbers are kept whole.
+
+    A single syllable left by a particle is indexed on its own next to the
+    whole word, as "콩을" is "콩" with a particle but "오이" is not "오".
+    """
+    terms = []
+    for word in WORD.findall(text.lower()):
+        if not HANGUL.fullmatch(word):
+            terms.append(word)
+            continue
+        for particle in PARTICLES:
+            if word.endswith(particle) and len(word) > len(particle):
+                stem = word[: -len(particle)]
+                if len(stem) == 1:
+                    terms.append(stem)
+                else:
+                    word = stem
+                break
+        if len(word) == 1:
+            terms.append(word)
+        else:
+            terms.extend(word[i : i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+def execute_script(conn, script):
+    """
+    Runs the statements of an SQL script one by one with `execute`, unlike
+    `executescript` without committing the current transaction first.
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+
+class FarmingLog:
+    """
+    Durable, append-only store for the farming log.
+
+    Entries live in a SQLite database in WAL mode. Appends are queued to a
+    dedicated writer thread which commits everything that is pending in a single
+    transaction, so the event loop never waits on disk and bursts of entries
+    share one fsync. Reads run on a separate connection in a worker thread.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        speaker TEXT NOT NULL,
+        transcript TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_date ON entries (date, time);
+
+    CREATE TABLE IF NOT EXISTS entry_keywords (
+        entry_id INTEGER NOT NULL REFERENCES entries (id),
+        keyword TEXT NOT NULL,
+        date TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entry_keywords_keyword ON entry_keywords (keyword, date);
+    CREATE INDEX IF NOT EXISTS entry_keywords_entry ON entry_keywords (entry_id);
+    """
+
+    # Applied in order to databases whose PRAGMA user_version is lower, either
+    # as SQL or as a method taking the connection
+    MIGRATIONS = [
+        """
+        ALTER TABLE entry_keywords ADD COLUMN category TEXT;
+        CREATE INDEX IF NOT EXISTS entry_keywords_category ON entry_keywords (category, date);
+        """,
+        "_create_search_index",
+        "_create_daily_summaries",
+        "_rebuild_search_index",
+    ]
+
+    # BM25 parameters for search ranking
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+
+    def __init__(self, path="farming_log.db"):
+        """
+        Opens (or creates) the farming log database.
+
+        :param path: Path of the SQLite database file.
+        """
+        self.path = path
+        self._queue = queue.Queue()
+        self._reader = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="farming-log-reader"
+        )
+        self._read_conn = None
+
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        # Each migration and its version bump commit together, a crash part
+        # way leaves the database at the previous version. executescript
+        # commits on its own, so migrations run statement by statement.
+        conn.isolation_level = None
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, migration in enumerate(self.MIGRATIONS[version:], start=version + 1):
+            conn.execute("BEGIN")
+            try:
+                if migration.startswith("_"):
+                    getattr(self, migration)(conn)
+                else:
+                    execute_script(conn, migration)
+                conn.execute(f"PRAGMA user_version={i}")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                conn.close()
+                raise
+            conn.execute("COMMIT")
+        conn.close()
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="farming-log-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints, which batches fsyncs
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, transcript, keywords, speaker="USER", timestamp=None):
+        """
+        Queues a log entry for writing and returns immediately.
+
+        :param transcript: Transcribed text of the utterance.
+        :param keywords: (keyword, category) pairs matched in the transcript.
+        :param speaker: Who said it.
+        :param timestamp: Time of the utterance, defaults to now.
+        :return: concurrent.futures.Future resolving to the new entry id.
+        """
+        future = Future()
+        timestamp = timestamp or datetime.now()
+        self._queue.put((timestamp, speaker, transcript, list(keywords), future))
+        return future
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = batch[-1] is None
+            batch = [item for item in batch if item is not None]
+            try:
+                with conn:
+                    ids = [self._insert(conn, *item[:4]) for item in batch]
+            except sqlite3.Error as e:
+                logging.error(f"Failed to write farming log: {e}")
+                for item in batch:
+                    item[4].set_exception(e)
+            else:
+                for item, entry_id in zip(batch, ids):
+                    item[4].set_result(entry_id)
+
+            if closing:
+                conn.close()
+                return
+
+    def _insert(self, conn, timestamp, speaker, transcript, keywords):
+        date = timestamp.strftime("%Y-%m-%d")
+        cursor = conn.execute(
+            "INSERT INTO entries (date, time, speaker, transcript) VALUES (?, ?, ?, ?)",
+            (date, timestamp.strftime("%H:%M:%S"), speaker, transcript),
+        )
+        entry_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO entry_keywords (entry_id, keyword, category, date)"
+            " VALUES (?, ?, ?, ?)",
+            [(entry_id, keyword, category, date) for keyword, category in keywords],
+        )
+        self._index(conn, entry_id, date, transcript)
+        self._summarize(conn, entry_id, date, timestamp.strftime("%H:%M:%S"), keywords)
+        return entry_id
+
+    def _create_search_index(self, conn):
+        execute_script(
+            conn,
+            """
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                entry_id INTEGER NOT NULL REFERENCES entries (id),
+                date TEXT NOT NULL,
+                tf INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS postings_term ON postings (term, date);
+
+            CREATE TABLE IF NOT EXISTS search_documents (
+                entry_id INTEGER PRIMARY KEY REFERENCES entries (id),
+                length INTEGER NOT NULL
+            );
+            """,
+        )
+        # Index whatever was logged before the search index existed
+        rows = conn.execute("SELECT id, date, transcript FROM entries").fetchall()
+        for entry_id, date, transcript in rows:
+            self._index(conn, entry_id, date, transcript)
+
+    def _rebuild_search_index(self, conn):
+        # Reindexes entries after a change to tokenize
+        conn.execute("DELETE FROM postings")
+        conn.execute("DELETE FROM search_documents")
+        rows = conn.execute("SELECT id, date, transcript FROM entries").fetchall()
+        for entry_id, date, transcript in rows:
+            self._index(conn, entry_id, date, transcript)
+
+    def _index(self, conn, entry_id, date, transcript):
+        terms = tokenize(transcript)
+        conn.executemany(
+            "INSERT INTO postings (term, entry_id, date, tf) VALUES (?, ?, ?, ?)",
+            [(term, entry_id, date, tf) for term, tf in Counter(terms).items()],
+        )
+        conn.execute(
+            "INSERT INTO search_documents (entry_id, length) VALUES (?, ?)",
+            (entry_id, len(terms)),
+        )
+
+    def _create_daily_summaries(self, conn):
+        execute_script(
+            conn,
+            """
+            CREATE TABLE IF NOT EXISTS daily_categories (
+                date TEXT NOT NULL,
+                category TEXT NOT NULL,
+                entries INTEGER NOT NULL,
+                PRIMARY KEY (date, category)
+            );
+
+            CREATE TABLE IF NOT EXISTS daily_topics (
+                date TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                category TEXT,
+                time TEXT NOT NULL,
+                entry_id INTEGER NOT NULL REFERENCES entries (id),
+                mentions INTEGER NOT NULL,
+                PRIMARY KEY (date, keyword)
+            );
+
+            CREATE TABLE IF NOT EXISTS daily_activity (
+                date TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                entries INTEGER NOT NULL,
+                PRIMARY KEY (date, hour)
+            );
+            """,
+        )
+        # Summarize whatever was logged before the summaries existed
+        keywords = {}
+        for entry_id, keyword, category in conn.execute(
+            "SELECT entry_id, keyword, category FROM entry_keywords"
+        ):
+            keywords.setdefault(entry_id, []).append((keyword, category))
+        rows = conn.execute("SELECT id, date, time FROM entries ORDER BY id").fetchall()
+        for entry_id, date, time in rows:
+            self._summarize(conn, entry_id, date, time, keywords.get(entry_id, []))
+
+    def _summarize(self, conn, entry_id, date, time, keywords):
+        categories = {category for _, category in keywords if category is not None}
+        conn.executemany(
+            "INSERT INTO daily_categories (date, category, entries) VALUES (?, ?, 1)"
+            " ON CONFLICT (date, category) DO UPDATE SET entries = entries + 1",
+            [(date, category) for category in categories],
+        )
+        # Entries can arrive out of order, the latest mention is kept by time
+        conn.executemany(
+            "INSERT INTO daily_topics"
+            " (date, keyword, category, time, entry_id, mentions)"
+            " VALUES (?, ?, ?, ?, ?, 1)"
+            " ON CONFLICT (date, keyword) DO UPDATE SET"
+            " mentions = mentions + 1,"
+            " category = CASE WHEN excluded.time >= time"
+            " THEN excluded.category ELSE category END,"
+            " entry_id = CASE WHEN excluded.time >= time"
+            " THEN excluded.entry_id ELSE entry_id END,"
+            " time = MAX(time, excluded.time)",
+            [
+                (date, keyword, category, time, entry_id)
+                for keyword, category in dict(keywords).items()
+            ],
+        )
+        conn.execute(
+            "INSERT INTO daily_activity (date, hour, entries) VALUES (?, ?, 1)"
+            " ON CONFLICT (date, hour) DO UPDATE SET entries = entries + 1",
+            (date, int(time[:2])),
+        )
+
+    async def _in_reader(self, function, *args):
+        def run():
+            if self._read_conn is None:
+                self._read_conn = self._connect()
+            return function(self._read_conn, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(self._reader, run)
+
+    async def _read(self, query, params=()):
+        return await self._in_reader(
+            lambda conn: conn.execute(query, params).fetchall()
+        )
+
+    async def entries(
+        self, start_date, end_date=None, keyword=None, category=None, limit=None
+    ):
+        """
+        Returns log entries between two dates (inclusive), oldest first.
+
+        :param start_date: First date as "YYYY-MM-DD".
+        :param end_date: Last date as "YYYY-MM-DD", defaults to start_date.
+        :param keyword: Only return entries that mention this keyword.
+        :param category: Only return entries that mention a term of this category.
+        :param limit: Maximum number of entries, counted from the newest.
+        :return: List of (date, time, speaker, transcript) tuples.
+        """
+        end_date = end_date or start_date
+        query = (
+            "SELECT e.date, e.time, e.speaker, e.transcript FROM entries e"
+            " WHERE e.date BETWEEN ? AND ?"
+        )
+        params = [start_date, end_date]
+        for column, value in (("keyword", keyword), ("category", category)):
+            if value is not None:
+                query += (
+                    " AND e.id IN (SELECT entry_id FROM entry_keywords"
+                    f" WHERE {column} = ? AND date BETWEEN ? AND ?)"
+                )
+                params += [value, start_date, end_date]
+        query += " ORDER BY e.date DESC, e.time DESC, e.id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = await self._read(query, params)
+        rows.reverse()
+        return rows
+
+    async def summary(self, start_date, end_date=None, topics=10):
+        """
+        Returns the pre-aggregated summary of the log between two dates
+        (inclusive). It is read from the daily summary tables, so its cost
+        does not grow with the number of entries.
+
+        :param start_date: First date as "YYYY-MM-DD".
+        :param end_date: Last date as "YYYY-MM-DD", defaults to start_date.
+        :param topics: Number of most recently mentioned topics to return.
+        :return: Dict with the number of entries, entries per category, the
+            latest mention of each topic as (keyword, category, date, time,
+            mentions, transcript) tuples, newest first, and entries per date
+            and per hour of the day.
+        """
+        return await self._in_reader(
+            self._summary, start_date, end_date or start_date, topics
+        )
+
+    def _summary(self, conn, start_date, end_date, topics):
+        by_date = Counter()
+        by_hour = Counter()
+        for date, hour, count in conn.execute(
+            "SELECT date, hour, entries FROM daily_activity"
+            " WHERE date BETWEEN ? AND ?",
+            (start_date, end_date),
+        ):
+            by_date[date] += count
+            by_hour[hour] += count
+        categories = dict(
+            conn.execute(
+                "SELECT category, SUM(entries) FROM daily_categories"
+                " WHERE date BETWEEN ? AND ? GROUP BY category"
+                " ORDER BY SUM(entries) DESC",
+                (start_date, end_date),
+            )
+        )
+        # With MAX(), SQLite takes the bare columns from the row of the maximum
+        latest = conn.execute(
+            "SELECT t.keyword, t.category, t.date, t.time, SUM(t.mentions),"
+            " e.transcript, MAX(t.date || ' ' || t.time) AS at"
+            " FROM daily_topics t JOIN entries e ON e.id = t.entry_id"
+            " WHERE t.date BETWEEN ? AND ? GROUP BY t.keyword"
+            " ORDER BY at DESC LIMIT ?",
+            (start_date, end_date, topics),
+        ).fetchall()
+        return {
+            "entries": sum(by_date.values()),
+            "categories": categories,
+            "topics": [row[:6] for row in latest],
+            "by_date": dict(sorted(by_date.items())),
+            "by_hour": dict(sorted(by_hour.items())),
+        }
+
+    async def search(self, query, start_date=None, end_date=None, limit=5):
+        """
+        Searches the log with BM25 ranking over the inverted index.
+
+        :param query: Free text query.
+        :param start_date: Only search from this date ("YYYY-MM-DD").
+        :param end_date: Only search up to this date ("YYYY-MM-DD").
+        :param limit: Number of results to return.
+        :return: List of (date, time, speaker, transcript) tuples, best first.
+            Equal scores are ordered newest first.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        return await self._in_reader(
+            self._search,
+            terms,
+            start_date or "0000-00-00",
+            end_date or "9999-99-99",
+            limit,
+        )
+
+    def _search(self, conn, terms, start_date, end_date, limit):
+        placeholders = ", ".join("?" * len(terms))
+        documents, total_length = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM search_documents"
+        ).fetchone()
+        if documents == 0:
+            return []
+        average_length = total_length / documents
+
+        idf = {
+            term: math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            for term, df in conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders})"
+                " GROUP BY term",
+                terms,
+            )
+        }
+        scores = Counter()
+        for entry_id, term, tf, length in conn.execute(
+            "SELECT p.entry_id, p.term, p.tf, d.length FROM postings p"
+            " JOIN search_documents d ON d.entry_id = p.entry_id"
+            f" WHERE p.term IN ({placeholders}) AND p.date BETWEEN ? AND ?",
+            [*terms, start_date, end_date],
+        ):
+            norm = self.BM25_K1 * (
+                1 - self.BM25_B + self.BM25_B * length / average_length
+            )
+            scores[entry_id] += idf[term] * tf * (self.BM25_K1 + 1) / (tf + norm)
+
+        # Entry ids grow with time, so they break ties in favour of recent entries
+        best = heapq.nlargest(
+            limit, scores, key=lambda entry_id: (scores[entry_id], entry_id)
+        )
+        if not best:
+            return []
+        rows = conn.execute(
+            "SELECT id, date, time, speaker, transcript FROM entries"
+            f" WHERE id IN ({', '.join('?' * len(best))})",
+            best,
+        ).fetchall()
+        by_id = {row[0]: row[1:] for row in rows}
+        return [by_id[entry_id] for entry_id in best]
+
+    async def close(self):
+        """
+        Flushes pending writes and closes the database.
+        """
+        self._queue.put(None)
+        await asyncio.to_thread(self._writer.join)
+        if self._read_conn is not None:
+            read_conn = self._read_conn
+            await asyncio.get_running_loop().run_in_executor(
+                self._reader, read_conn.close
+            )
+        self._reader.shutdown()
+
+
+def format_entry(entry):
+    _date, time, speaker, transcript = entry
+    return f"[{time}] {speaker}: {transcript}"
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import threading
+import time
+
+import cv2
+
+
+class Frame:
+    """
+    One captured frame and the variants derived from it.
+
+    The JPEG encoding is computed on first use and memoized, so however many
+    consumers ask for it, it runs at most once per frame. Safe to use from
+    worker threads. The models' RGB inputs are not kept here, the vision
+    backend converts the BGR image on its own threads or processes.
+    """
+
+    def __init__(self, seq, bgr, timestamp):
+        self.seq = seq
+        self.bgr = bgr
+        self.timestamp = timestamp
+        self._jpeg = None
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    @property
+    def jpeg(self):
+        with self._lock:
+            if self._jpeg is None:
+                _, buffer = cv2.imencode(".jpg", self.bgr)
+                self._jpeg = buffer.tobytes()
+            return self._jpeg
+
+
+class FrameSource:
+    def __init__(self, stream):
+        """
+        Captures frames from a cv2.VideoCapture once and shares them with every
+        vision consumer.
+
+        :param stream: cv2.VideoCapture object for accessing video stream.
+        """
+        self.stream = stream
+        self.latest = None
+        self.frames_captured = 0
+        self.stopped = False
+        self._new_frame = asyncio.Condition()
+        self.task = asyncio.create_task(self.capture())
+
+    def isOpened(self):
+        return self.stream.isOpened()
+
+    async def capture(self):
+        """
+        Reads frames as fast as the camera delivers them.
+        """
+        seq = 0
+        while True:
+            ret, bgr = await asyncio.to_thread(self.stream.read)
+            if not ret:
+                logging.error("Unable to read frame from the video stream.")
+                async with self._new_frame:
+                    self.stopped = True
+                    self._new_frame.notify_all()
+                break
+
+            seq += 1
+            self.frames_captured = seq
+            async with self._new_frame:
+                self.latest = Frame(seq, bgr, time.time())
+                self._new_frame.notify_all()
+
+    async def next_frame(self, after_seq=0):
+        """
+        Waits for a frame newer than `after_seq` and returns it, or None once
+        the camera has stopped. Frames a consumer was too slow to see are
+        skipped.
+        """
+        async with self._new_frame:
+            await self._new_frame.wait_for(
+                lambda: self.stopped
+                or (self.latest is not None and self.latest.seq > after_seq)
+            )
+            return None if self.stopped else self.latest
+
+    def release(self):
+        self.task.cancel()
+        self.stream.release()
@@ -1,10 +1,15 @@
 import cv2
-import mediapipe as mp
 import numpy as np
 from scipy.fft import fft
 import time
 import logging
 import asyncio
+import os
+import zipfile
+from frames import FrameSource
+from scheduler import VisionScheduler
+from functools import partial
+from vision_backend import FaceMeshModel, ThreadBackend
 
 
 class Tool:
@@ -15,25 +20,75 @@ class Tool:
 
 
 class HeartRateMonitor(Tool):
-    def __init__(self, stream, sampling_rate=30, roi_size=20, update_interval=100):
+    # Width of the image fed to FaceMesh, the forehead ROI is still sampled at full resolution
+    MODEL_INPUT_WIDTH = 640
+    # FaceMesh landmarks around the forehead
+    FOREHEAD_POINTS = (330, 425, 280)
+    MODELS = {"face": partial(FaceMeshModel, FOREHEAD_POINTS)}
+    # Seconds of signal needed for a first estimate, before a full update_interval
+    FIRST_ESTIMATE_AFTER = 10
+    # Seconds a result is reused when the model asks again
+    CACHE_TTL = 5
+
+    def __init__(
+        self,
+        frames,
+        sampling_rate=30,
+        roi_size=20,
+        update_interval=100,
+        scheduler=None,
+        backend=None,
+        snapshot_path=None,
+        snapshot_interval=5,
+        snapshot_max_age=120,
+        snapshot_max_gap=5,
+    ):
         """
-        Initializes the HeartRateMonitor class with an external cv2 VideoCapture stream.
+        Initializes the HeartRateMonitor class with a shared frame source.
+
+        The signal buffer and the latest BPM are snapshotted to disk, so a
+        quick restart resumes from them instead of starting over.
 
-        :param stream: cv2.VideoCapture object for accessing video stream.
-        :param sampling_rate: Number of frames per second to sample.
+        :param frames: FrameSource providing the camera frames.
+        :param sampling_rate: Number of frames per second to sample while a face is visible.
         :param roi_size: Size of the region of interest around the forehead.
         :param update_interval: Interval in seconds to update heart rate value.
+        :param scheduler: VisionScheduler deciding the actual frame rate.
+        :param backend: Vision backend running FaceMesh.
+        :param snapshot_path: .npz file for the snapshot, None to disable it.
+        :param snapshot_interval: Seconds between snapshots.
+        :param snapshot_max_age: Older snapshots are ignored.
+        :param snapshot_max_gap: The signal buffer is only resumed if the
+            snapshot is at most this many seconds old, a longer gap in the
+            signal would distort the spectrum. The BPM is still resumed.
         """
-        self.stream = stream
+        self.frames = frames
+        self.backend = backend or ThreadBackend()
+        for name, factory in self.MODELS.items():
+            self.backend.add_model(name, factory)
+        self.scheduler = scheduler or VisionScheduler()
+        self.scheduler.register(
+            "heart_rate", rate=sampling_rate, idle_rate=2, priority=0.4
+        )
         self.sampling_rate = sampling_rate
         self.roi_size = roi_size
         self.update_interval = update_interval  # Interval to update heart rate
         self.latest_bpm = None  # Store the latest BPM value
+        self.green_channel_values = []
+        self.sample_times = []
+        self.last_update_time = time.time()
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_max_age = snapshot_max_age
+        self.snapshot_max_gap = snapshot_max_gap
+        self.last_snapshot_time = time.time()
+        if snapshot_path is not None:
+            self.load_snapshot()
         self.name = "monitor_heart_rate"
         self.description = {
             "type": "function",
             "name": "monitor_heart_rate",
-            "description": "Measure the heart rate from a webcam feed in real-time. Make sure to check this value every two sentence",
+            "description": "Measure the heart rate from a webcam feed in real-time. Changes are also sent to you as status messages, so only call this when you need a fresh value.",
             "parameters": {},
         }
         self.function = self.get_heart_rate
@@ -45,61 +100,69 @@ class HeartRateMonitor(Tool):
         Monitors heart rate using the video stream and calculates the heart rate from the green channel.
         This method updates the heart rate every `update_interval` seconds.
         """
-        # MediaPipe setup
-        mp_face_mesh = mp.solutions.face_mesh
-        face_mesh = mp_face_mesh.FaceMesh(
-            static_image_mode=False, max_num_faces=1, min_detection_confidence=0.5
-        )
-
-        # Initialize variables
-        green_channel_values = []
-        frame_count = 0
-        last_update_time = time.time()
 
         def apply_hamming_window(signal):
             window = np.hamming(len(signal))
             return signal * window
 
-        def get_forehead_coordinates(face_landmarks, frame_width, frame_height):
-            forehead_points = [face_landmarks.landmark[i] for i in [330, 425, 280]]
-            forehead_x = int(np.mean([p.x * frame_width for p in forehead_points]))
-            forehead_y = int(np.mean([p.y * frame_height for p in forehead_points]))
+        def get_forehead_coordinates(forehead_points, frame_width, frame_height):
+            forehead_x = int(np.mean(forehead_points[:, 0]) * frame_width)
+            forehead_y = int(np.mean(forehead_points[:, 1]) * frame_height)
             return forehead_x, forehead_y
 
         logging.info("Heart rate monitoring started...")
 
         # Continuously monitor heart rate
+        seq = 0
         while True:
-            start_time = time.time()  # Start the timer for this frame
-            ret, frame = await asyncio.to_thread(self.stream.read)
-            if not ret:
-                logging.error("Unable to read frame from the video stream.")
+            captured = await self.frames.next_frame(seq)
+            if captured is None:
                 break
+            seq = captured.seq
+            frame = captured.bgr
+
+            forehead_points = await self.backend.process(
+                "face", frame, width=self.MODEL_INPUT_WIDTH
+            )
+
+            if forehead_points is not None:
+                self.scheduler.face_seen()
+                h, w, _ = frame.shape
+                forehead_x, forehead_y = get_forehead_coordinates(
+                    forehead_points, w, h
+                )
 
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = face_mesh.process(rgb_frame)
-
-            if results.multi_face_landmarks:
-                for face_landmarks in results.multi_face_landmarks:
-                    h, w, _ = frame.shape
-                    forehead_x, forehead_y = get_forehead_coordinates(
-                        face_landmarks, w, h
-                    )
-
-                    # Define ROI for the forehead area
-                    roi = frame[
-                        forehead_y - self.roi_size : forehead_y + self.roi_size,
-                        forehead_x - self.roi_size : forehead_x + self.roi_size,
-                    ]
-
-                    if roi.size > 0:
-                        green_channel = np.mean(roi[:, :, 1])
-                        green_channel_values.append(green_channel)
-                        frame_count += 1
-
-            # Calculate and update heart rate every `update_interval` seconds
-            if time.time() - last_update_time >= self.update_interval:
-                windowed_signal = apply_hamming_window(np.array(green_channel_values))
+                # Define ROI for the forehead area
+                roi = frame[
+                    forehead_y - self.roi_size : forehead_y + self.roi_size,
+                    forehead_x - self.roi_size : forehead_x + self.roi_size,
+                ]
+
+                if roi.size > 0:
+                    green_channel = np.mean(roi[:, :, 1])
+                    self.green_channel_values.append(green_channel)
+                    self.sample_times.append(captured.timestamp)
+
+            sample_times = self.sample_times
+            green_channel_values = self.green_channel_values
+            # Calculate and update heart rate every `update_interval` seconds,
+            # and once as soon as there is enough signal after a cold start
+            first_estimate = (
+                self.latest_bpm is None
+                and len(sample_times) > 1
+                and sample_times[-1] - sample_times[0] >= self.FIRST_ESTIMATE_AFTER
+            )
+            if first_estimate or (
+                time.time() - self.last_update_time >= self.update_interval
+                and len(sample_times) > 1
+            ):
+                # The scheduler varies the frame rate, so resample the signal to
+                # a uniform `sampling_rate` before the FFT
+                uniform_times = np.arange(
+                    sample_times[0], sample_times[-1], 1 / self.sampling_rate
+                )
+                signal = np.interp(uniform_times, sample_times, green_channel_values)
+                windowed_signal = apply_hamming_window(signal)
                 n = len(windowed_signal)
                 freqs = np.fft.fftfreq(n, d=1 / self.sampling_rate)
                 fft_values = np.abs(fft(windowed_signal - np.mean(windowed_signal)))
@@ -117,16 +180,67 @@ class HeartRateMonitor(Tool):
                     self.latest_bpm = bpm
                     logging.info(f"Heart rate updated: {bpm:.2f} bpm")
 
-                green_channel_values = []
-                frame_count = 0
-                last_update_time = time.time()
+                if not first_estimate:
+                    self.green_channel_values = []
+                    self.sample_times = []
+                    self.last_update_time = time.time()
+                await self.save_snapshot()
+            elif (
+                self.snapshot_path is not None
+                and time.time() - self.last_snapshot_time >= self.snapshot_interval
+            ):
+                await self.save_snapshot()
+
+            # Wait for the next tick at the rate the scheduler currently allows
+            await self.scheduler.wait("heart_rate")
+
+    def load_snapshot(self):
+        # Read completely before anything is applied, a damaged snapshot
+        # starts cold instead of half resumed
+        try:
+            with np.load(self.snapshot_path) as snapshot:
+                saved_at = float(snapshot["saved_at"])
+                latest_bpm = float(snapshot["latest_bpm"])
+                green_channel_values = snapshot["green_channel_values"].tolist()
+                sample_times = snapshot["sample_times"].tolist()
+                last_update_time = float(snapshot["last_update_time"])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile) as e:
+            logging.warning(f"Ignoring heart rate snapshot {self.snapshot_path}: {e!r}")
+            return
+        age = time.time() - saved_at
+        if age > self.snapshot_max_age:
+            return
+        if not np.isnan(latest_bpm):
+            self.latest_bpm = latest_bpm
+        if age <= self.snapshot_max_gap:
+            self.green_channel_values = green_channel_values
+            self.sample_times = sample_times
+            self.last_update_time = last_update_time
+        logging.info(
+            f"Resumed heart rate from a {age:.0f} s old snapshot with "
+            f"{len(self.sample_times)} samples"
+        )
+
+    async def save_snapshot(self):
+        if self.snapshot_path is None:
+            return
+        self.last_snapshot_time = time.time()
+        snapshot = {
+            "saved_at": self.last_snapshot_time,
+            "latest_bpm": np.nan if self.latest_bpm is None else self.latest_bpm,
+            "green_channel_values": np.array(self.green_channel_values),
+            "sample_times": np.array(self.sample_times),
+            "last_update_time": self.last_update_time,
+        }
+        await asyncio.to_thread(self._write_snapshot, snapshot)
 
-            # Calculate elapsed time for the frame and adjust sleep time to match sampling rate
-            elapsed_time = time.time() - start_time
-            sleep_time = max(
-                0, (1 / self.sampling_rate) - elapsed_time
-            )  # Ensure non-negative sleep time
-            await asyncio.sleep(sleep_time)  # Sleep to maintain the desired frame rate
+    def _write_snapshot(self, snapshot):
+        # Written aside and renamed, a crash mid-write must not lose the last one
+        tmp_path = self.snapshot_path + ".tmp.npz"
+        np.savez(tmp_path, **snapshot)
+        os.replace(tmp_path, self.snapshot_path)
 
     async def get_heart_rate(self, args):
         """
@@ -147,7 +261,7 @@ async def main():
         logging.error("Error opening video stream.")
     else:
         heart_rate_tool = HeartRateMonitor(
-            cap, update_interval=100, sampling_rate=30
+            FrameSource(cap), update_interval=100, sampling_rate=30
         )  # Update every 10 seconds, sampling rate of 30 fps
 
         # Periodically call get_heart_rate at regular intervals (e.g., every 3 seconds)
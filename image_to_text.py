@@ -1,5 +1,5 @@
 import os
-import cv2
+import asyncio
 import dotenv
 import logging
 from openai import AsyncOpenAI
@@ -16,7 +16,10 @@ class Tool:
 
 # Define the Webcam Capture and Description Tool
 class ImageDescriptionTool(Tool):
-    def __init__(self, openai_api_key, stream):
+    # Seconds a description is reused when the model asks again
+    CACHE_TTL = 10
+
+    def __init__(self, openai_api_key, frames):
         self.name = "image_description"
         self.description = {
             "type": "function",
@@ -27,41 +30,34 @@ class ImageDescriptionTool(Tool):
         self.openai_api_key = openai_api_key
         self.function = self.capture_and_describe_image
         self.client = AsyncOpenAI()
-        self.cap = stream
+        self.frames = frames
 
     async def capture_and_describe_image(self, arguments):
-        image = self.capture_image()
+        frame = await self.capture_image()
         logging.info("Captured image")
-        image_base64 = self.convert_image_to_base64(image)
+        image_base64 = await asyncio.to_thread(self.convert_image_to_base64, frame)
         logging.info("Converted image to base64")
         description = await self.get_image_description(image_base64)
         logging.info("Got image description")
 
         return {"description": description}
 
-    def capture_image(self):
-        # Open the webcam (default camera 0)
-
+    async def capture_image(self):
         # Check if the webcam is opened correctly
-        if not self.cap.isOpened():
+        if not self.frames.isOpened():
             raise Exception("Could not open webcam")
 
-        # Capture a single frame
-        ret, frame = self.cap.read()
+        # Use the latest frame from the shared capture, waiting for the first one
+        frame = self.frames.latest or await self.frames.next_frame()
 
-        if not ret:
+        if frame is None:
             raise Exception("Failed to capture image")
 
-        # Release the webcam after capture
-
-        # Return the captured image
         return frame
 
-    def convert_image_to_base64(self, image):
-        # Convert the image (numpy array) to a format suitable for OpenAI API (base64 encoded)
-        _, buffer = cv2.imencode(".jpg", image)
-        img_bytes = buffer.tobytes()
-        image_base64 = base64.b64encode(img_bytes).decode("utf-8")
+    def convert_image_to_base64(self, frame):
+        # The JPEG encoding is cached on the frame (base64 encoded for the OpenAI API)
+        image_base64 = base64.b64encode(frame.jpeg).decode("utf-8")
         return image_base64
 
     async def get_image_description(self, image_base64):
@@ -94,7 +90,7 @@ class ImageDescriptionTool(Tool):
             return f"Error while getting description: {e}"
 
     def close(self):
-        self.cap.release()
+        self.frames.release()
 
 
 # Usage Example:
@@ -106,7 +102,5 @@ if __name__ == "__main__":
     tool = ImageDescriptionTool(openai_api_key=openai.api_key)
 
     # You can now call the tool's function asynchronously
-    import asyncio
-
     result = asyncio.run(tool.capture_and_describe_image({}))
     print(result)
@@ -0,0 +1,141 @@
+import json
+from collections import deque
+
+from farming_log import HANGUL, PARTICLES
+
+# Suffix marking a term that is only matched as a whole word, optionally
+# followed by a particle, e.g. "사과$" matches "사과를" but not "사과했어"
+WHOLE_WORD = "$"
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick matcher over a categorized farming vocabulary.
+
+    The automaton is built once from the vocabulary, after which every term of
+    every category is found in a single pass over the text. The cost of a match
+    depends on the length of the text and the number of hits, not on the size
+    of the vocabulary.
+
+    Terms are only matched at the start of a word, Korean has no spaces inside
+    compounds but a term found after another syllable is usually part of an
+    unrelated word, e.g. "적과" in "목적과".
+    """
+
+    def __init__(self, vocabulary):
+        """
+        Builds the matcher.
+
+        :param vocabulary: Mapping of category name to a list of terms. Terms
+            ending in "$" are only matched as whole words.
+        """
+        self.vocabulary = vocabulary
+        # State 0 is the root. Each state has its transitions, a failure link and
+        # the (term, category) pairs that end there.
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._whole_words = set()
+
+        for category, terms in vocabulary.items():
+            for term in terms:
+                if term.endswith(WHOLE_WORD):
+                    term = term[: -len(WHOLE_WORD)]
+                    self._whole_words.add(term)
+                if term:
+                    self._add(term, category)
+        self._build_failure_links()
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads the vocabulary from a JSON file of {"category": ["term", ...]}.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _add(self, term, category):
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        if (term, category) not in self._output[state]:
+            self._output[state].append((term, category))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # Terms that are suffixes of this one end here as well
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def find(self, text):
+        """
+        Returns every distinct (term, category) pair that occurs in the text,
+        in order of first occurrence.
+
+        A match that lies entirely inside a longer one is dropped, so
+        "가지치기" is not also tagged as the crop "가지", nor "애호박" as "호박".
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        occurrences = []  # (start, end, term, category) in order found
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term, category in output[state]:
+                start = end - len(term)
+                if self._at_word_boundary(text, start, end, term):
+                    occurrences.append((start, end, term, category))
+
+        # Sorted by start and longest first, every span that could contain a
+        # match comes before it. Equal spans, one term in several categories,
+        # do not hide each other.
+        contained = set()
+        covered_end = -1
+        span = None
+        group_covered = -1
+        for start, end, _term, _category in sorted(
+            occurrences, key=lambda o: (o[0], -o[1])
+        ):
+            if (start, end) != span:
+                span = (start, end)
+                group_covered = covered_end
+                covered_end = max(covered_end, end)
+            if end <= group_covered:
+                contained.add(span)
+
+        matches = {}
+        for start, end, term, category in occurrences:
+            if (start, end) not in contained:
+                matches.setdefault((term, category), None)
+        return list(matches)
+
+    def _at_word_boundary(self, text, start, end, term):
+        if start > 0 and HANGUL.match(text[start - 1]):
+            return False
+        if term not in self._whole_words:
+            return True
+        rest = HANGUL.match(text, end)
+        return rest is None or rest.group() in PARTICLES
+
+    def categories(self, text):
+        """
+        Returns the set of categories mentioned in the text.
+        """
+        return {category for _term, category in self.find(text)}
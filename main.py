@@ -1,20 +1,36 @@
 import asyncio
+import atexit
 import json
 import base64
 import os
-from collections import deque
 import logging
+import threading
+import time
+from functools import partial
 from typing import List
-import cv2
 from dotenv import load_dotenv
 import pyaudio
 import websockets
-from datetime import datetime
+from datetime import datetime, timedelta
 from audio import AudioPlayer, AudioRecorder
+from audio_sender import AudioSender
+from barge_in import BargeInGate
+from echo_canceller import EchoCanceller
 from control import ControlServer
 from heart_rate import HeartRateMonitor
 from pose_estimate import PoseEstimator
 from image_to_text import ImageDescriptionTool
+from cameras import Cameras
+from scheduler import VisionScheduler
+from vision_backend import create_backend
+from farming_log import FarmingLog, format_entry
+from keyword_matcher import KeywordMatcher
+from metrics import registry
+from recorder import SessionRecorder
+from status import StatusMonitor
+from emergency import AlertRelay, EmergencyMonitor, ScreamDetector
+from telemetry import SerialTelemetry
+from weather import Weather
 
 
 class RealTimeChat:
@@ -31,34 +47,114 @@ class RealTimeChat:
         turn_threshold=0.5,
         prefix_padding_ms=300,
         silence_duration_ms=500,
-        input_buffer_size=8192,
+        chunk_ms=40,
+        max_chunk_ms=200,
+        send_queue_size=50,
+        farming_log=None,
+        vocabulary_path="farming_vocabulary.json",
+        barge_in_threshold_db=-30,
+        barge_in_hold_ms=1000,
+        full_duplex=False,
+        recorder=None,
+        started_at=None,
+        status_monitor=None,
+        status_interval=1.0,
+        emergency=None,
     ):
-        self.input_buffer_size = input_buffer_size
         self.input_device_index = input_device_index
         self.output_device_index = output_device_index
-        self.input_buffer = deque(maxlen=self.input_buffer_size)
+        self.chunk_ms = chunk_ms
+        self.max_chunk_ms = max_chunk_ms
+        self.send_queue_size = send_queue_size
         self.voice = voice
         self.turn_threshold = turn_threshold
         self.prefix_padding_ms = prefix_padding_ms
         self.silence_duration_ms = silence_duration_ms
         self.pending_events = {}
-        self.headers = {
-            "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
-            "OpenAI-Beta": "realtime=v1",
-        }
         self.responses = {}
         self.playing = False
+        # Guards Response.audio, which the output callback consumes on PortAudio's thread
+        self.playback_lock = threading.Lock()
+        # While playing, mic input clearly louder than the robot's own echo
+        # opens the mic for a while, so the server can hear the user talking
+        # over the robot
+        self.barge_in = BargeInGate(
+            threshold_db=barge_in_threshold_db, hold_ms=barge_in_hold_ms
+        )
+        # Keeps the mic open during playback and removes the robot's own voice
+        # from it instead of relying on the barge-in gate
+        self.full_duplex = full_duplex
+        self.echo_canceller = None
+        self.recorder = recorder
+        # Startup milestones in ms since `started_at`, the process start for
+        # the first session and the reconnect for later ones
+        self.started_at = started_at or time.monotonic()
+        self.startup = {}
+        self.session_ready = asyncio.Event()
+        # Pushes vitals and pose into the conversation when they change
+        self.status_monitor = status_monitor
+        self.status_interval = status_interval
+        # (tool name, arguments) -> (time, output), for tools with a CACHE_TTL
+        self.tool_results = {}
+        self.local_answers = 0
+        # Listens to the capture stream for screams, on the robot itself
+        self.emergency = emergency
         self.tools: List[Tool] = tools
-        self.farming_log = {}
-        self.keywords = ["딸기", "해충", "수확", "비료"]
+        self.farming_log: FarmingLog = farming_log
+        self.keyword_matcher = KeywordMatcher.from_file(vocabulary_path)
 
     @classmethod
-    async def setup(cls, tools):
-        self = cls(tools=tools)
-        self.websocket = await websockets.connect(
-            self.URL, additional_headers=self.headers
+    async def connect(cls):
+        websocket = await websockets.connect(
+            cls.URL,
+            additional_headers={
+                "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
+                "OpenAI-Beta": "realtime=v1",
+            },
         )
         logging.info("Connected to OpenAI Realtime API")
+        return websocket
+
+    @classmethod
+    async def setup(
+        cls,
+        tools,
+        farming_log=None,
+        full_duplex=False,
+        recorder=None,
+        websocket=None,
+        started_at=None,
+        status_monitor=None,
+        emergency=None,
+    ):
+        """
+        :param websocket: Already connected websocket, e.g. opened while the
+            rest of the robot was starting up. Connects if None.
+        :param started_at: time.monotonic() the startup metrics count from.
+        """
+        self = cls(
+            tools=tools,
+            farming_log=farming_log,
+            full_duplex=full_duplex,
+            recorder=recorder,
+            started_at=started_at,
+            status_monitor=status_monitor,
+            emergency=emergency,
+        )
+        self.websocket = websocket or await self.connect()
+        self.mark_startup("connected_ms")
+        self.audio_sender = AudioSender(
+            self.websocket,
+            sample_rate=self.SAMPLE_RATE,
+            bytes_per_frame=self.BYTES_PER_FRAME,
+            chunk_ms=self.chunk_ms,
+            max_chunk_ms=self.max_chunk_ms,
+            queue_size=self.send_queue_size,
+        )
+        if self.full_duplex:
+            self.echo_canceller = EchoCanceller(
+                self.cleaned_audio, sample_rate=self.SAMPLE_RATE
+            )
         return self
 
     async def update(
@@ -91,33 +187,60 @@ class RealTimeChat:
         try:
             response = await future
             logging.info(json.dumps(response, indent=4))
+            self.mark_startup("session_ready_ms")
+            self.session_ready.set()
             return response
         except asyncio.CancelledError:
             logging.error("Update task was cancelled")
 
     def audio_input_callback(self, in_data, _frame_count, _time_info, _status):
-        if not self.playing:
-            self.input_buffer.extend(in_data)
-        if len(self.input_buffer) == self.input_buffer_size:
-            logging.info("Input buffer is overflowing")
+        if self.recorder is not None:
+            self.recorder.record("mic_audio", in_data)
+        if self.echo_canceller is not None:
+            self.echo_canceller.add_capture(in_data)
+            return (bytes(), pyaudio.paContinue)
+        if self.emergency is not None:
+            # Before the barge-in gate, a scream must be heard while the robot talks
+            self.emergency.feed_audio(in_data, playing=self.playing)
+        if self.barge_in.passes(in_data, self.playing):
+            self.audio_sender.capture(in_data)
         return (bytes(), pyaudio.paContinue)
 
+    def cleaned_audio(self, data):
+        """
+        Receives mic audio with the robot's voice removed, in full duplex.
+        """
+        self.audio_sender.capture(data)
+        if self.emergency is not None:
+            self.emergency.feed_audio(data)
+
     def audio_output_callback(self, _in_data, frame_count, _time_info, _status):
         total_bytes = self.BYTES_PER_FRAME * frame_count
-        for response in self.responses.values():
-            if len(response.audio) >= self.BYTES_PER_FRAME:
-                end_idx = min(len(response.audio), total_bytes)
-                frame = response.audio[:end_idx]
-                response.audio = response.audio[end_idx:]
-                frame = bytes(total_bytes - end_idx) + frame
-                self.playing = True
-                return (frame, pyaudio.paContinue)
-        self.playing = False
-        return (bytes(frame_count * self.BYTES_PER_FRAME), pyaudio.paContinue)
+        with self.playback_lock:
+            for response in self.responses.values():
+                if len(response.audio) >= self.BYTES_PER_FRAME:
+                    end_idx = min(len(response.audio), total_bytes)
+                    frame = response.audio[:end_idx]
+                    response.audio = response.audio[end_idx:]
+                    response.played_bytes += end_idx
+                    frame = bytes(total_bytes - end_idx) + frame
+                    self.playing = True
+                    break
+            else:
+                self.playing = False
+                frame = bytes(total_bytes)
+        if self.echo_canceller is not None:
+            self.echo_canceller.add_reference(frame)
+        else:
+            self.barge_in.playback(frame)
+        return (frame, pyaudio.paContinue)
 
     async def message_handler(self, message):
         data = json.loads(message)
         message_type = data.get("type")
+        if self.recorder is not None and message_type != "response.audio.delta":
+            # Audio deltas are recorded decoded, as assistant_audio
+            self.recorder.record("server_event", message)
         if message_type in self.pending_events.keys():
             future = self.pending_events[message_type].get_nowait()
             future.set_result(data)
@@ -138,11 +261,19 @@ class RealTimeChat:
             if item_type == "function_call":
                 for tool in self.tools:
                     if item.get("name") == tool.description["name"]:
-                        if item.get("name") == "log_briefing":
-                            function_response = await tool.function(self.farming_log)
-                        else:
-                            function_response = await tool.function(item.get("arguments"))
+                        function_response = await self.call_tool(
+                            tool, item.get("arguments")
+                        )
                         logging.info(f"Function response: {function_response}")
+                        if self.recorder is not None:
+                            self.recorder.record(
+                                "tool_call",
+                                {
+                                    "name": item.get("name"),
+                                    "arguments": item.get("arguments"),
+                                    "output": function_response,
+                                },
+                            )
                         await self.websocket.send(
                             json.dumps(
                                 {
@@ -170,7 +301,7 @@ class RealTimeChat:
         elif message_type == "created":
             logging.info(json.dumps(data, indent=4))
         elif message_type.startswith("input_audio_buffer"):
-            self.input_audio_buffer_message_handler(message_type, data)
+            await self.input_audio_buffer_message_handler(message_type, data)
         elif message_type.startswith("response"):
             self.response_message_handler(message_type, data)
         elif message_type == "error":
@@ -178,10 +309,95 @@ class RealTimeChat:
         else:
             logging.info(json.dumps(data, indent=4))
 
-    def input_audio_buffer_message_handler(self, message_type, data):
+    async def call_tool(self, tool, arguments):
+        """
+        Runs a tool, or answers from its last result if the model repeats an
+        identical call within the tool's CACHE_TTL.
+        """
+        ttl = getattr(tool, "CACHE_TTL", 0)
+        key = (tool.name, arguments or "")
+        cached = self.tool_results.get(key)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            self.local_answers += 1
+            return cached[1]
+        result = await tool.function(arguments)
+        if ttl:
+            self.tool_results[key] = (time.monotonic(), result)
+        return result
+
+    async def status_injection_loop(self):
+        """
+        Adds the farmer's status to the conversation whenever it changes
+        materially, so the model does not have to poll for it. A fall also
+        asks for a response right away, unless the emergency monitor already
+        alerted on it.
+        """
+        self.status_monitor.reset()
+        while True:
+            await asyncio.sleep(self.status_interval)
+            status = self.status_monitor.report()
+            if status is None:
+                continue
+            await self.websocket.send(
+                json.dumps(
+                    {
+                        "type": "conversation.item.create",
+                        "item": {
+                            "type": "message",
+                            "role": "system",
+                            "content": [
+                                {
+                                    "type": "input_text",
+                                    "text": f"Farmer status: {json.dumps(status)}",
+                                }
+                            ],
+                        },
+                    }
+                )
+            )
+            logging.info(f"Sent status update: {status}")
+            # A second response.create would collide with the alert's response
+            if status["fall_detected"] and self.emergency is None:
+                await self.websocket.send(json.dumps({"type": "response.create"}))
+
+    async def send_alert(self, alert):
+        """
+        Tells the model about an emergency detected on the robot and has it
+        respond right away.
+        """
+        if alert["confirmed"]:
+            detected = "a fall and a scream"
+        elif alert["kind"] == "fall":
+            detected = "what looks like a fall"
+        else:
+            detected = f"a {alert['kind']}"
+        text = (
+            f"Emergency: the robot detected {detected}. Check on the farmer "
+            "immediately and offer to call for help."
+        )
+        age = time.time() - alert["detected_at"]
+        if age > 5:
+            # Held while reconnecting
+            text += f" It happened {age:.0f} seconds ago."
+        await self.websocket.send(
+            json.dumps(
+                {
+                    "type": "conversation.item.create",
+                    "item": {
+                        "type": "message",
+                        "role": "system",
+                        "content": [{"type": "input_text", "text": text}],
+                    },
+                }
+            )
+        )
+        await self.websocket.send(json.dumps({"type": "response.create"}))
+
+    async def input_audio_buffer_message_handler(self, message_type, data):
         message = message_type.split(".")[1]
         if message == "speech_started":
             logging.info("User started speaking")
+            await self.interrupt()
         elif message == "speech_stopped":
             logging.info("User stopped speaking")
         elif message == "committed":
@@ -189,18 +405,79 @@ class RealTimeChat:
         else:
             logging.info(json.dumps(data, indent=4))
 
+    async def interrupt(self):
+        """
+        Stops the assistant when the user starts talking over it: flushes the
+        local playback, cancels the response if it is still being generated and
+        truncates the assistant's item to what the user actually heard.
+        """
+        start = time.perf_counter()
+        interrupted = []
+        with self.playback_lock:
+            for response_id, response in self.responses.items():
+                if response.done and not response.audio:
+                    continue
+                response.audio = bytes()
+                response.cancelled = True
+                interrupted.append((response_id, response))
+        # Resume capture right away instead of waiting for the output callback
+        self.playing = False
+        self.barge_in.close()
+
+        for response_id, response in interrupted:
+            if not response.done:
+                await self.websocket.send(
+                    json.dumps({"type": "response.cancel", "response_id": response_id})
+                )
+            if response.item_id is not None and response.played_bytes > 0:
+                audio_end_ms = (
+                    response.played_bytes
+                    * 1000
+                    // (self.BYTES_PER_FRAME * self.SAMPLE_RATE)
+                )
+                await self.websocket.send(
+                    json.dumps(
+                        {
+                            "type": "conversation.item.truncate",
+                            "item_id": response.item_id,
+                            "content_index": 0,
+                            "audio_end_ms": audio_end_ms,
+                        }
+                    )
+                )
+        if interrupted:
+            logging.info(
+                f"Interrupted assistant in {(time.perf_counter() - start) * 1000:.1f} ms"
+            )
+
     def response_message_handler(self, message_type, data):
         message = message_type.split(".")
         if message[1] == "created":
             response_data = data.get("response")
             response = Response(status=response_data.get("status"))
-            self.responses[response_data.get("id")] = response
+            # The output callback iterates the responses on PortAudio's thread
+            with self.playback_lock:
+                self.responses[response_data.get("id")] = response
             logging.info("Response was created")
+        elif message[1] == "done":
+            response = self.responses.get(data.get("response", {}).get("id"))
+            if response is not None:
+                response.done = True
+            logging.info("Response was done")
         elif message[1] == "audio":
             if message[2] == "delta":
+                response = self.responses[data.get("response_id")]
+                if response.cancelled:
+                    # Still in flight when the user interrupted
+                    return
+                self.mark_startup("first_response_ms")
                 delta_bytes = base64.b64decode(data.get("delta"))
                 logging.info(data.get("response_id"))
-                self.responses[data.get("response_id")].audio += delta_bytes
+                response.item_id = data.get("item_id")
+                if self.recorder is not None:
+                    self.recorder.record("assistant_audio", delta_bytes)
+                with self.playback_lock:
+                    response.audio += delta_bytes
             elif message[2] == "done":
                 logging.info("Response audio was done")
             else:
@@ -226,70 +503,67 @@ class RealTimeChat:
             sample_rate=self.SAMPLE_RATE,
             callback=self.audio_output_callback,
         )
+        registry.register("audio_input", self.audio_recorder.metrics)
+        registry.register("audio_output", self.audio_player.metrics)
+        registry.register("barge_in", self.barge_in.metrics)
         message_polling_task = asyncio.create_task(self.message_polling_loop())
-        buffer_polling_task = asyncio.create_task(self.input_buffer_polling())
+        audio_sender_task = asyncio.create_task(self.audio_sender.run())
         update = self.update(
             instructions=(
-                "You are an assisting robot named 'nongsimi(농심이)' for elderly farmers in Korea. Introduce yourself with name in the beginning of the conversation. Talk in Korean. Try to act like a 20 y/o human. Be spontaneous, ask random questions if necessary, and do not make it cringe. Be empathetic, but do not give an impression that you are empathetic since this can offend the farmer. Keep your response short like how most humans talk. You are trying to be a honest friend to him, so do not give him generic response, and you don't need to end your sentence conclusively or ask questions every time. You should always call a function if you can. Check the the farmer's status frequently using these functions. Speak in a fast, and make sure to talk naturally by using filler words. Monitor the user's tone and screaming sound to detect accidents, and call for emergency services if so."
+                "You are an assisting robot named 'nongsimi(농심이)' for elderly farmers in Korea. Introduce yourself with name in the beginning of the conversation. Talk in Korean. Try to act like a 20 y/o human. Be spontaneous, ask random questions if necessary, and do not make it cringe. Be empathetic, but do not give an impression that you are empathetic since this can offend the farmer. Keep your response short like how most humans talk. You are trying to be a honest friend to him, so do not give him generic response, and you don't need to end your sentence conclusively or ask questions every time. Call a function when you need information you do not have. The farmer's heart rate and whether they have fallen are sent to you as status messages whenever they change, so you do not need to check them yourself. If a fall is reported, check on the farmer right away. Speak in a fast, and make sure to talk naturally by using filler words. Monitor the user's tone and screaming sound to detect accidents, and call for emergency services if so."
             ),
         )
 
-        await asyncio.gather(message_polling_task, buffer_polling_task, update)
-
-    async def input_buffer_polling(self):
-        while True:
-            try:
-                if len(self.input_buffer) > 0:
-                    logging.debug(f"Input buffer size: {len(self.input_buffer)}")
-                    query_type = "input_audio_buffer.append"
-                    input_bytes = bytes(
-                        [
-                            self.input_buffer.popleft()
-                            for _ in range(len(self.input_buffer))
-                        ]
-                    )
-                    input_bytes = base64.b64encode(input_bytes)
-                    await self.websocket.send(
-                        json.dumps(
-                            {
-                                "type": query_type,
-                                "audio": input_bytes.decode("utf-8"),
-                            }
-                        )
-                    )
-
-            except websockets.exceptions.ConnectionClosedError:
-                logging.warning("Connection closed")
-                break
+        update_task = asyncio.create_task(update)
+        tasks = [audio_sender_task, update_task]
+        if self.status_monitor is not None:
+            tasks.append(asyncio.create_task(self.status_injection_loop()))
 
-            await asyncio.sleep(0.05)
+        # The session lasts as long as the connection
+        await message_polling_task
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
     async def message_polling_loop(self):
-        while True:
-            try:
-                async for message in self.websocket:
-                    await self.message_handler(message)
-
-            except websockets.exceptions.ConnectionClosedError:
-                logging.warning("Connection closed")
-                break
-
-            await asyncio.sleep(0.05)
+        try:
+            async for message in self.websocket:
+                await self.message_handler(message)
+        except websockets.exceptions.ConnectionClosedError:
+            pass
+        # The iteration also ends when the server closes the connection normally
+        logging.warning("Connection closed")
+
+    def mark_startup(self, milestone):
+        if milestone not in self.startup:
+            elapsed = (time.monotonic() - self.started_at) * 1000
+            self.startup[milestone] = elapsed
+            logging.info(f"Startup: {milestone} = {elapsed:.0f}")
+
+    def startup_metrics(self):
+        return dict(self.startup)
+
+    def tool_metrics(self):
+        return {"local_answers": self.local_answers}
+
+    async def close(self):
+        for device in (
+            getattr(self, "audio_recorder", None),
+            getattr(self, "audio_player", None),
+            self.echo_canceller,
+        ):
+            if device is not None:
+                device.close()
+        await self.websocket.close()
 
     def update_farming_log(self, transcript):
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        current_time = datetime.now().strftime("%H:%M:%S")
-
-        for keyword in self.keywords:
-            if keyword in transcript:
-                log_entry = f"[{current_time}] USER: {transcript}"
-
-                if current_date not in self.farming_log:
-                    self.farming_log[current_date] = []
-
-                self.farming_log[current_date].append(log_entry)
-                break
+        if self.farming_log is None:
+            return
 
+        matches = self.keyword_matcher.find(transcript)
+        if matches:
+            # Written on the log's own thread, the event loop does not wait
+            self.farming_log.append(transcript, matches)
 
 
 class Tool:
@@ -299,56 +573,122 @@ class Tool:
         self.function = function
 
 
-class Weather(Tool):
-    def __init__(self):
-        self.name = "get_weather"
+class Briefing(Tool):
+    PERIODS = {"today": 1, "week": 7, "month": 30}
+    RECENT_ENTRIES = 5
+    MAX_TOPICS = 10
+    MAX_TEXT_LENGTH = 200
+
+    def __init__(self, farming_log):
+        self.farming_log = farming_log
+        self.name = "log_briefing"
         self.description = {
             "type": "function",
-            "name": "get_weather",
-            "description": "Get the current weather for a location, tell the user you are fetching the weather.",
+            "name": "log_briefing",
+            "description": "Provide a summary or briefing of the farming log for today, the past week or the past month: how much was logged per category, the latest mention of each topic and when the farmer was active.",
             "parameters": {
                 "type": "object",
-                "properties": {"location": {"type": "string"}},
-                "required": ["location"],
+                "properties": {
+                    "period": {
+                        "type": "string",
+                        "enum": list(self.PERIODS),
+                        "description": "Defaults to today",
+                    },
+                },
+                "required": [],
             },
         }
-        self.function = self.get_weather
-
-    async def get_weather(self, arguments):
-        # dummy response
-        logging.info(f"Fetching weather for {arguments}")
-        data = {
-            "location": "daejeon",
-            "temperature": 4,
-            "humidity": 50,
-            "unit": "Celcius",
+        self.function = self.log_briefing
+
+    async def log_briefing(self, arguments):
+        arguments = json.loads(arguments or "{}")
+        period = arguments.get("period") or "today"
+        days = self.PERIODS.get(period, 1)
+        today = datetime.now()
+        end_date = today.strftime("%Y-%m-%d")
+        start_date = (today - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+        summary = await self.farming_log.summary(
+            start_date, end_date, topics=self.MAX_TOPICS
+        )
+        if not summary["entries"]:
+            return {"period": period, "briefing": "이 기간의 영농일지가 비어 있습니다."}
+
+        # Served from the daily summaries, so the payload stays the same size
+        # however much was logged
+        briefing = {
+            "period": period,
+            "start_date": start_date,
+            "end_date": end_date,
+            "entries": summary["entries"],
+            "categories": summary["categories"],
+            "topics": [
+                {
+                    "keyword": keyword,
+                    "category": category,
+                    "last_mentioned": f"{date} {time}",
+                    "mentions": mentions,
+                    "text": text[: self.MAX_TEXT_LENGTH],
+                }
+                for keyword, category, date, time, mentions, text in summary["topics"]
+            ],
         }
-        return data
+        if period == "today":
+            briefing["activity_by_hour"] = summary["by_hour"]
+            entries = await self.farming_log.entries(
+                end_date, limit=self.RECENT_ENTRIES
+            )
+            briefing["recent"] = [
+                format_entry(entry)[: self.MAX_TEXT_LENGTH] for entry in entries
+            ]
+        else:
+            briefing["activity_by_date"] = summary["by_date"]
+        return briefing
 
-class Briefing(Tool):
-    def __init__(self):
-        self.name = "log_briefing"
+
+class FarmingLogSearch(Tool):
+    MAX_RESULTS = 10
+    MAX_TEXT_LENGTH = 200
+
+    def __init__(self, farming_log):
+        self.farming_log = farming_log
+        self.name = "search_farming_log"
         self.description = {
             "type": "function",
-            "name": "log_briefing",
-            "description": "Provide a summary or briefing of today's farming log.",
+            "name": "search_farming_log",
+            "description": "Search past farming log entries, e.g. to find when the farmer last applied fertilizer to the strawberries. Results are ranked by relevance and include the date and time of each entry.",
             "parameters": {
                 "type": "object",
-                "properties": {},
-                "required": [],
+                "properties": {
+                    "query": {"type": "string"},
+                    "start_date": {"type": "string", "description": "YYYY-MM-DD"},
+                    "end_date": {"type": "string", "description": "YYYY-MM-DD"},
+                    "limit": {"type": "integer"},
+                },
+                "required": ["query"],
             },
         }
-        self.function = self.log_briefing
-
-    async def log_briefing(self, log):
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        if current_date not in log or not log[current_date]:
-            briefing = "오늘 영농일지가 비어 있습니다."
-        else:
-            entries = log[current_date]
-            briefing = f"오늘의 영농일지 브리핑:\n" + "\n".join(entries)
+        self.function = self.search_farming_log
 
-        return {"briefing": briefing}
+    async def search_farming_log(self, arguments):
+        arguments = json.loads(arguments or "{}")
+        try:
+            limit = min(max(int(arguments.get("limit") or 5), 1), self.MAX_RESULTS)
+        except (TypeError, ValueError):
+            limit = 5
+        entries = await self.farming_log.search(
+            arguments.get("query", ""),
+            start_date=arguments.get("start_date"),
+            end_date=arguments.get("end_date"),
+            limit=limit,
+        )
+        # Keep the payload small, it goes back over the Realtime websocket
+        return {
+            "results": [
+                {"date": date, "time": time, "text": text[: self.MAX_TEXT_LENGTH]}
+                for date, time, _speaker, text in entries
+            ]
+        }
 
 
 class Response:
@@ -356,23 +696,140 @@ class Response:
         self.transcript = ""
         self.audio = bytes()
         self.status = status
+        self.item_id = None
+        self.played_bytes = 0
+        self.done = False
+        self.cancelled = False
 
 
 async def main():
+    started_at = time.monotonic()
     load_dotenv()
-    weather = Weather()
-    briefing = Briefing()
-    stream = cv2.VideoCapture(0)
+    # The slow parts of startup run side by side: the websocket connects and
+    # the vision models load while everything else is set up
+    websocket_task = asyncio.create_task(RealTimeChat.connect())
+    # "process" runs each vision model in its own worker process
+    vision_backend = create_backend(os.getenv("VISION_BACKEND", "thread"))
+    models_task = asyncio.create_task(
+        vision_backend.preload({**PoseEstimator.MODELS, **HeartRateMonitor.MODELS})
+    )
+    recorder = None
+    if os.getenv("RECORD_DIR"):
+        recorder = SessionRecorder(
+            os.path.join(
+                os.getenv("RECORD_DIR"), datetime.now().strftime("%Y%m%d-%H%M%S")
+            ),
+            metadata={"sample_rate": RealTimeChat.SAMPLE_RATE},
+        )
+        atexit.register(recorder.close)
+        registry.register("recorder", recorder.metrics)
+    farming_log = FarmingLog(os.getenv("FARMING_LOG_PATH", "farming_log.db"))
+    telemetry = SerialTelemetry(port=os.getenv("SERIAL_PORT", "/dev/ttyACM0"))
+    registry.register("telemetry", telemetry.metrics)
+    weather = Weather(
+        telemetry=telemetry,
+        default_location=os.getenv("WEATHER_LOCATION", "Daejeon"),
+    )
+    registry.register("weather_cache", weather.cache.metrics)
+    briefing = Briefing(farming_log)
+    log_search = FarmingLogSearch(farming_log)
+    cameras = Cameras.from_file(os.getenv("CAMERAS_CONFIG", "cameras.json"))
+    registry.register("cameras", cameras.metrics)
+    scheduler = VisionScheduler(backend=vision_backend)
+    registry.register("vision", scheduler.metrics)
+    await models_task
+    logging.info(
+        f"Vision models ready after {(time.monotonic() - started_at) * 1000:.0f} ms"
+    )
     heart_rate = HeartRateMonitor(
-        stream=stream, sampling_rate=30, roi_size=20, update_interval=20
+        frames=cameras.source_for("heart_rate"),
+        sampling_rate=30,
+        roi_size=20,
+        update_interval=20,
+        scheduler=scheduler,
+        backend=vision_backend,
+        snapshot_path=os.getenv("HEART_RATE_SNAPSHOT", "heart_rate_snapshot.npz"),
     )
-    image_description = ImageDescriptionTool(os.getenv("OPENAI_API_KEY"), stream)
-    chat = await RealTimeChat.setup(tools=[weather, image_description, heart_rate, briefing])
-    chat_task = asyncio.create_task(chat.run())
-
-    pose_estimator = PoseEstimator(stream)
-
-    control_server = ControlServer(pose_estimator)
+    image_description = ImageDescriptionTool(
+        os.getenv("OPENAI_API_KEY"), cameras.source_for("image_description")
+    )
+    emergency = EmergencyMonitor(ScreamDetector(sample_rate=RealTimeChat.SAMPLE_RATE))
+    registry.register("emergency", emergency.metrics)
+    if recorder is not None:
+        emergency.add_hook(partial(recorder.record, "emergency"))
+    pose_estimator = PoseEstimator(
+        cameras.source_for("pose"),
+        scheduler=scheduler,
+        backend=vision_backend,
+        recorder=recorder,
+        on_fall=emergency.report_fall,
+    )
+    registry.register("pose", pose_estimator.metrics)
+    status_monitor = StatusMonitor(heart_rate, pose_estimator)
+    registry.register("status", status_monitor.metrics)
+    tools = [
+        weather,
+        image_description,
+        heart_rate,
+        briefing,
+        log_search,
+        telemetry,
+    ]
+
+    # Alerts raised between sessions are sent once the next one is ready
+    alert_relay = AlertRelay()
+    emergency.add_hook(alert_relay)
+
+    async def attach_alerts(chat):
+        await chat.session_ready.wait()
+        await alert_relay.attach(chat.send_alert)
+
+    async def chat_sessions():
+        """
+        Runs Realtime sessions back to back, reconnecting when one ends. The
+        rest of the robot, models included, carries on across sessions.
+        """
+        try:
+            websocket = await websocket_task
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            logging.error(f"Could not connect to the Realtime API: {e}")
+            websocket = None
+        session_started_at = started_at
+        while True:
+            try:
+                chat = await RealTimeChat.setup(
+                    tools=tools,
+                    farming_log=farming_log,
+                    full_duplex=os.getenv("FULL_DUPLEX", "0") == "1",
+                    recorder=recorder,
+                    websocket=websocket,
+                    started_at=session_started_at,
+                    status_monitor=status_monitor,
+                    emergency=emergency,
+                )
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                logging.error(f"Could not connect to the Realtime API: {e}")
+            else:
+                registry.register("startup", chat.startup_metrics)
+                registry.register("audio_sender", chat.audio_sender.metrics)
+                registry.register("tools", chat.tool_metrics)
+                if chat.echo_canceller is not None:
+                    registry.register("echo_canceller", chat.echo_canceller.metrics)
+                attach_task = asyncio.create_task(attach_alerts(chat))
+                try:
+                    await chat.run()
+                finally:
+                    attach_task.cancel()
+                    alert_relay.detach()
+                    await chat.close()
+            logging.warning("Realtime session ended, reconnecting")
+            websocket = None
+            await asyncio.sleep(1)
+            session_started_at = time.monotonic()
+
+    chat_task = asyncio.create_task(chat_sessions())
+
+    control_server = ControlServer(pose_estimator, recorder=recorder)
     control_task = asyncio.create_task(control_server.run_server())
 
     await asyncio.gather(chat_task, control_task)
@@ -0,0 +1,29 @@
+import logging
+
+
+class MetricsRegistry:
+    """
+    Collects runtime metrics from the robot's subsystems.
+
+    A source is any callable returning a flat dict of values. Sources are only
+    called when metrics are collected, so registering one costs nothing on the
+    hot path.
+    """
+
+    def __init__(self):
+        self.sources = {}
+
+    def register(self, name, source):
+        self.sources[name] = source
+
+    def collect(self):
+        metrics = {}
+        for name, source in self.sources.items():
+            try:
+                metrics[name] = source()
+            except Exception as e:
+                logging.warning(f"Failed to collect metrics from {name}: {e}")
+        return metrics
+
+
+registry = MetricsRegistry()
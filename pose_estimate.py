@@ -2,6 +2,19 @@ import cv2
 import mediapipe as mp
 import asyncio
 import math
+import numpy as np
+from frames import FrameSource
+from scheduler import VisionScheduler
+from vision_backend import PoseModel, ThreadBackend
+from fall_detection import (
+    FallDetector,
+    LandmarkHistory,
+    LEFT_SHOULDER,
+    RIGHT_SHOULDER,
+    LEFT_HIP,
+    RIGHT_HIP,
+    pack_pose_record,
+)
 
 
 class Tool:
@@ -12,8 +25,34 @@ class Tool:
 
 
 class PoseEstimator(Tool):
-    def __init__(self, stream):
-        self.stream = stream
+    # Width of the image fed to the pose model, landmarks are normalized so this
+    # does not change the outputs' coordinate frame
+    MODEL_INPUT_WIDTH = 640
+    # While following the farmer, only a square crop around them is processed,
+    # at the pose landmark model's own input size
+    ROI_INPUT_SIZE = 256
+    ROI_MARGIN = 0.25
+    # Minimum visibility of the torso landmarks for a crop result to be trusted
+    ROI_MIN_VISIBILITY = 0.5
+    # Crops get a separate graph, so neither one's internal tracking state
+    # sees images in the other's coordinate frame
+    MODELS = {"pose": PoseModel, "pose_roi": PoseModel}
+
+    def __init__(
+        self, frames, scheduler=None, backend=None, recorder=None, on_fall=None
+    ):
+        """
+        :param on_fall: Called with the timestamp of the drop as soon as a
+            fall is suspected, e.g. EmergencyMonitor.report_fall. Waiting
+            for the confirmation would add the detector's still time to
+            the alert.
+        """
+        self.frames = frames
+        self.recorder = recorder
+        self.on_fall = on_fall
+        # Full rate only in autonomous mode or after a suspected fall
+        self.scheduler = scheduler or VisionScheduler()
+        self.scheduler.register("pose", rate=30, idle_rate=5, priority=0.8)
         self.name = "estimate_pose"
         self.description = {
             "type": "function",
@@ -22,9 +61,17 @@ class PoseEstimator(Tool):
             "parameters": {},
         }
         self.function = self.get_current_pose
-        self.pose = mp.solutions.pose.Pose(
-            min_detection_confidence=0.5, min_tracking_confidence=0.5
-        )
+        # Models run on the backend's threads or worker processes and return
+        # landmark arrays
+        self.backend = backend or ThreadBackend()
+        for name, factory in self.MODELS.items():
+            self.backend.add_model(name, factory)
+        self.tracking = False
+        self.roi_frames = 0
+        self.full_frames = 0
+        # Landmarks are converted to arrays once per frame and kept for a few seconds
+        self.history = LandmarkHistory(capacity=90)
+        self.fall_detector = FallDetector()
         self.fall_detected = False
         self.latest_position = None
         self.task = asyncio.create_task(self.estimate_pose())
@@ -33,28 +80,114 @@ class PoseEstimator(Tool):
         """
         Continuously captures frames from the webcam and processes them to detect and display pose landmarks.
         """
+        seq = 0
         while True:
-            start_time = asyncio.get_event_loop().time()
-            ret, frame = await asyncio.to_thread(self.stream.read)
-            if not ret:
-                print("Unable to read frame from the video stream.")
+            frame = await self.frames.next_frame(seq)
+            if frame is None:
                 break
+            seq = frame.seq
+            h, w, _ = frame.shape
 
-            image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.pose.process(image)
+            landmarks, world_landmarks = None, None
+            roi = None
+            if self.tracking and self.scheduler.autonomous:
+                roi = self.person_roi(self.history.latest(), w, h)
+            if roi is not None:
+                landmarks, world_landmarks = await self.process_roi(frame, roi)
+            if landmarks is None:
+                # Not following, or lost the farmer in the crop: re-detect on the full frame
+                self.full_frames += 1
+                result = await self.backend.process(
+                    "pose", frame.bgr, width=self.MODEL_INPUT_WIDTH
+                )
+                if result is not None:
+                    landmarks, world_landmarks = result
+            else:
+                self.roi_frames += 1
+            self.tracking = landmarks is not None
 
-            if results.pose_landmarks:
-                self.fall_detected = self.detect_fall(results.pose_landmarks)
+            if landmarks is not None:
+                landmarks = self.history.append(landmarks, frame.timestamp)
+                was_suspected = self.fall_detector.suspected_at is not None
+                self.fall_detected, fall_suspected = self.fall_detector.update(
+                    self.history, aspect=w / h
+                )
+                if fall_suspected and not was_suspected and self.on_fall:
+                    self.on_fall(self.fall_detector.suspected_at)
+                if self.fall_detected or fall_suspected:
+                    self.scheduler.suspect_fall()
+                if self.recorder is not None:
+                    self.recorder.record(
+                        "pose",
+                        pack_pose_record(
+                            landmarks, w, h, self.fall_detected, fall_suspected
+                        ),
+                        timestamp=frame.timestamp,
+                    )
                 self.latest_position = self.calculate_farmer_position(
-                    results.pose_landmarks
+                    landmarks, world_landmarks
                 )
 
-            # Maintain frame rate
-            elapsed_time = asyncio.get_event_loop().time() - start_time
-            await asyncio.sleep(max(0, (1 / 30) - elapsed_time))  # Assuming 30 fps
+            # Maintain the frame rate the scheduler currently allows
+            await self.scheduler.wait("pose")
 
             print("-------")
 
+    def person_roi(self, landmarks, width, height):
+        """
+        Returns a square crop (x0, y0, side) in pixels around the visible
+        landmarks with a margin, or None if the farmer fills too much of the
+        frame for cropping to help.
+        """
+        visible = landmarks[landmarks[:, 3] > self.ROI_MIN_VISIBILITY]
+        if len(visible) < 4:
+            return None
+        xs = visible[:, 0] * width
+        ys = visible[:, 1] * height
+        side = max(xs.max() - xs.min(), ys.max() - ys.min()) * (1 + 2 * self.ROI_MARGIN)
+        side = max(side, self.ROI_INPUT_SIZE)
+        if side >= min(width, height):
+            return None
+        # Keep the crop inside the frame by shifting rather than shrinking it
+        x0 = np.clip((xs.min() + xs.max() - side) / 2, 0, width - side)
+        y0 = np.clip((ys.min() + ys.max() - side) / 2, 0, height - side)
+        return int(x0), int(y0), int(side)
+
+    async def process_roi(self, frame, roi):
+        """
+        Runs the pose model on a crop of the frame and maps the landmarks back
+        to full frame coordinates.
+
+        :return: (landmarks, world_landmarks), or (None, None) if the farmer
+            was not found in the crop.
+        """
+        x0, y0, side = roi
+        # A view, the backend resizes and converts it off the event loop
+        crop = frame.bgr[y0 : y0 + side, x0 : x0 + side]
+        result = await self.backend.process(
+            "pose_roi", crop, size=(self.ROI_INPUT_SIZE, self.ROI_INPUT_SIZE)
+        )
+        if result is None:
+            return None, None
+
+        landmarks, world_landmarks = result
+        torso = landmarks[[LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP], 3]
+        if torso.mean() < self.ROI_MIN_VISIBILITY:
+            return None, None
+
+        h, w, _ = frame.shape
+        landmarks[:, 0] = (x0 + landmarks[:, 0] * side) / w
+        landmarks[:, 1] = (y0 + landmarks[:, 1] * side) / h
+        landmarks[:, 2] *= side / w
+        return landmarks, world_landmarks
+
+    def metrics(self):
+        processed = self.roi_frames + self.full_frames
+        return {
+            "roi_share": self.roi_frames / processed if processed else 0.0,
+            "fall_detected": self.fall_detected,
+        }
+
     async def get_current_pose(self):
         """
         Returns the current pose information, including fall detection status and farmer's position.
@@ -69,69 +202,49 @@ class PoseEstimator(Tool):
             else None,
         }
 
-    def calculate_farmer_position(self, landmarks):
+    def calculate_farmer_position(self, landmarks, world_landmarks):
         """
-        Calculates the direction and distance for the farmer's pose using landmarks.
+        Calculates the direction and distance for the farmer's pose using
+        (33, 4) landmark arrays of image and world coordinates.
         """
-        if landmarks is None:
+        if landmarks is None or world_landmarks is None:
             return None
 
-        try:
-            # Get relevant landmarks
-            left_shoulder = landmarks.landmark[
-                mp.solutions.pose.PoseLandmark.LEFT_SHOULDER
-            ]
-            right_shoulder = landmarks.landmark[
-                mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER
-            ]
-            left_hip = landmarks.landmark[mp.solutions.pose.PoseLandmark.LEFT_HIP]
-            right_hip = landmarks.landmark[mp.solutions.pose.PoseLandmark.RIGHT_HIP]
-            world_landmarks = self.pose.process(
-                cv2.cvtColor(self.stream.read()[1], cv2.COLOR_BGR2RGB)
-            ).pose_world_landmarks
+        # Get relevant landmarks
+        left_shoulder = landmarks[LEFT_SHOULDER]
+        right_shoulder = landmarks[RIGHT_SHOULDER]
+        left_hip = landmarks[LEFT_HIP]
+        right_hip = landmarks[RIGHT_HIP]
 
-            hip_center = (left_hip.x + right_hip.x) / 2
-            hip_center = hip_center * 2 - 1
-
-            # Calculate the shoulder-to-shoulder distance in world coordinates
-            shoulder_distance_world = None
-            if world_landmarks:
-                left_shoulder_world = world_landmarks.landmark[
-                    mp.solutions.pose.PoseLandmark.LEFT_SHOULDER
-                ]
-                right_shoulder_world = world_landmarks.landmark[
-                    mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER
-                ]
-                if left_shoulder_world is None or right_shoulder_world is None:
-                    return None
-                shoulder_distance_world = math.sqrt(
-                    (left_shoulder_world.x - right_shoulder_world.x) ** 2
-                    + (left_shoulder_world.y - right_shoulder_world.y) ** 2
-                )
-            else:
-                return None
-
-            # 2D screen coordinate distance
-            shoulder_distance_pixel = math.sqrt(
-                (left_shoulder.x - right_shoulder.x) ** 2
-                + (left_shoulder.y - right_shoulder.y) ** 2
-            )
-
-            # Compute actual distance using the focal length scaling approach
-            focal_length = 0.75  # Replace with actual focal length if available
-            actual_shoulder_distance = (
-                (shoulder_distance_world * focal_length) / shoulder_distance_pixel
-                if shoulder_distance_pixel > 0
-                else None
-            )
+        hip_center = (left_hip[0] + right_hip[0]) / 2
+        hip_center = float(hip_center * 2 - 1)
 
-            return {
-                "direction": hip_center,
-                "distance": actual_shoulder_distance,
-            }
-        except IndexError as e:
-            print(f"Failed to calculate farmer position: {e}")
-            return None
+        # Calculate the shoulder-to-shoulder distance in world coordinates
+        left_shoulder_world = world_landmarks[LEFT_SHOULDER]
+        right_shoulder_world = world_landmarks[RIGHT_SHOULDER]
+        shoulder_distance_world = math.sqrt(
+            (left_shoulder_world[0] - right_shoulder_world[0]) ** 2
+            + (left_shoulder_world[1] - right_shoulder_world[1]) ** 2
+        )
+
+        # 2D screen coordinate distance
+        shoulder_distance_pixel = math.sqrt(
+            (left_shoulder[0] - right_shoulder[0]) ** 2
+            + (left_shoulder[1] - right_shoulder[1]) ** 2
+        )
+
+        # Compute actual distance using the focal length scaling approach
+        focal_length = 0.75  # Replace with actual focal length if available
+        actual_shoulder_distance = (
+            (shoulder_distance_world * focal_length) / shoulder_distance_pixel
+            if shoulder_distance_pixel > 0
+            else None
+        )
+
+        return {
+            "direction": hip_center,
+            "distance": actual_shoulder_distance,
+        }
 
     def calculate_farmer_position_(self, landmarks):
         """
@@ -165,26 +278,13 @@ class PoseEstimator(Tool):
             print(f"Failed to calculate farmer position: {e}")
             return None
 
-    def detect_fall(self, landmarks):
-        if landmarks is None:
-            return False
-
-        nose = landmarks.landmark[mp.solutions.pose.PoseLandmark.NOSE]
-        left_hip = landmarks.landmark[mp.solutions.pose.PoseLandmark.LEFT_HIP]
-        right_hip = landmarks.landmark[mp.solutions.pose.PoseLandmark.RIGHT_HIP]
-
-        # Assume fall if the nose's y-coordinate is not significantly higher than the hips'
-        if nose.y > (left_hip.y + right_hip.y) / 2:
-            return True
-        return False
-
 
 async def main():
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         print("Error opening video stream.")
     else:
-        pose_estimator = PoseEstimator(cap)
+        pose_estimator = PoseEstimator(FrameSource(cap))
         try:
             while True:
                 await asyncio.sleep(1)
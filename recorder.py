@@ -0,0 +1,309 @@
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+STREAMS = (
+    "mic_audio",
+    "assistant_audio",
+    "server_event",
+    "tool_call",
+    "pose",
+    "motor",
+    "emergency",
+)
+STREAM_IDS = {name: i for i, name in enumerate(STREAMS)}
+
+# timestamp, stream id, flags, payload length
+RECORD_HEADER = struct.Struct("<dBBI")
+# offset and length in the blob segment
+BLOB_REF = struct.Struct("<QI")
+FLAG_BLOB = 1
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<u8")])
+# Seconds a record may be logged after its timestamp, e.g. a pose result
+# stamped with its frame's capture time. The log is only in time order up
+# to this much.
+REORDER_WINDOW = 2.0
+
+EVENTS_FILE = "events.log"
+BLOBS_FILE = "blobs.bin"
+INDEX_FILE = "index.bin"
+SESSION_FILE = "session.json"
+
+
+class SessionRecorder:
+    """
+    Records a session for replay: audio, server events, tool calls, pose
+    results and motor commands.
+
+    Every record goes to an append-only log of small fixed-header records.
+    Binary payloads such as audio and landmark arrays go to a memory-mapped
+    blob segment and the log only holds a reference to them. A sparse index
+    of (timestamp, log offset) lets a reader seek to any point in time
+    without scanning the log. Its timestamp is the latest one of all records
+    before the offset, which keeps seeking correct for records logged late.
+
+    `record` only timestamps the payload and queues it; a writer thread
+    writes the queue in batches.
+    """
+
+    GROW_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, path, index_interval=0.5, metadata=None):
+        """
+        :param path: Directory the session is written to, created if needed.
+            A session already in it is overwritten.
+        :param index_interval: Seconds between index entries.
+        :param metadata: JSON-serializable session details, e.g. sample rates.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.index_interval = index_interval
+        self.started_at = time.time()
+        with open(os.path.join(path, SESSION_FILE), "w") as f:
+            json.dump(
+                {
+                    "started_at": self.started_at,
+                    "streams": list(STREAMS),
+                    **(metadata or {}),
+                },
+                f,
+            )
+
+        self.events = open(os.path.join(path, EVENTS_FILE), "wb")
+        self.index = open(os.path.join(path, INDEX_FILE), "wb")
+        self.events_size = 0
+        self.latest_timestamp = 0.0
+        self.next_index_at = 0.0
+
+        self.blob_fd = os.open(
+            os.path.join(path, BLOBS_FILE), os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644
+        )
+        self.blob_size = 0
+        self.blob_capacity = 0
+        self.blobs = None
+        self.grow(1)
+
+        self.queue = queue.Queue()
+        self.records = 0
+        self.dropped = 0
+        self.batch_ms = 0.0
+        self.closed = False
+        self.writer = threading.Thread(
+            target=self.write_loop, name="session-recorder", daemon=True
+        )
+        self.writer.start()
+
+    def record(self, stream, payload, timestamp=None):
+        """
+        Queues a record. Safe to call from any thread.
+
+        :param stream: One of STREAMS.
+        :param payload: bytes-like for the blob segment, or a JSON string or
+            JSON-serializable object kept inline in the log.
+        :param timestamp: Wall clock time of the event, defaults to now.
+        """
+        if self.closed:
+            return
+        if isinstance(payload, (bytearray, memoryview)):
+            payload = bytes(payload)
+        self.queue.put((timestamp or time.time(), STREAM_IDS[stream], payload))
+
+    def grow(self, needed):
+        if needed <= self.blob_capacity:
+            return
+        capacity = max(self.blob_capacity, self.GROW_SIZE)
+        while capacity < needed:
+            capacity *= 2
+        if self.blobs is not None:
+            self.blobs.close()
+        os.ftruncate(self.blob_fd, capacity)
+        self.blobs = mmap.mmap(self.blob_fd, capacity)
+        self.blob_capacity = capacity
+
+    def write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is None
+            if done:
+                batch.pop()
+            start = time.perf_counter()
+            try:
+                self.write_batch(batch)
+            except Exception:
+                self.dropped += len(batch)
+                logging.exception("Failed to write session records")
+            self.batch_ms = (time.perf_counter() - start) * 1000
+            if done:
+                break
+
+    def write_batch(self, batch):
+        # Sizes and index state are only updated once the batch is written,
+        # a failed write must not shift the offsets of later records
+        chunks = []
+        index = []
+        events_size = self.events_size
+        blob_size = self.blob_size
+        latest_timestamp = self.latest_timestamp
+        next_index_at = self.next_index_at
+        for timestamp, stream_id, payload in batch:
+            if isinstance(payload, bytes):
+                self.grow(blob_size + len(payload))
+                self.blobs[blob_size : blob_size + len(payload)] = payload
+                data = BLOB_REF.pack(blob_size, len(payload))
+                blob_size += len(payload)
+                flags = FLAG_BLOB
+            else:
+                if not isinstance(payload, str):
+                    payload = json.dumps(payload, ensure_ascii=False)
+                data = payload.encode()
+                flags = 0
+
+            if timestamp >= next_index_at:
+                index.append((latest_timestamp, events_size))
+                next_index_at = timestamp + self.index_interval
+            latest_timestamp = max(latest_timestamp, timestamp)
+            header = RECORD_HEADER.pack(timestamp, stream_id, flags, len(data))
+            chunks.append(header)
+            chunks.append(data)
+            events_size += len(header) + len(data)
+
+        self.events.write(b"".join(chunks))
+        self.events.flush()
+        self.events_size = events_size
+        self.blob_size = blob_size
+        self.latest_timestamp = latest_timestamp
+        self.next_index_at = next_index_at
+        if index:
+            self.index.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+            self.index.flush()
+        self.records += len(batch)
+
+    def metrics(self):
+        return {
+            "records": self.records,
+            "dropped_records": self.dropped,
+            "queue_depth": self.queue.qsize(),
+            "batch_ms": self.batch_ms,
+            "events_bytes": self.events_size,
+            "blob_bytes": self.blob_size,
+        }
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+        self.blobs.close()
+        # Give back the unused part of the last segment
+        os.ftruncate(self.blob_fd, self.blob_size)
+        os.close(self.blob_fd)
+        self.events.close()
+        self.index.close()
+
+
+class SessionReader:
+    """
+    Reads a recorded session. The log and blob segment are memory-mapped, so
+    only the records actually read are paged in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, SESSION_FILE)) as f:
+            self.session = json.load(f)
+        self.started_at = self.session["started_at"]
+        self.streams = self.session["streams"]
+        self.events = self._map(os.path.join(path, EVENTS_FILE))
+        self.blobs = self._map(os.path.join(path, BLOBS_FILE))
+        self.index = np.fromfile(os.path.join(path, INDEX_FILE), dtype=INDEX_DTYPE)
+
+    @staticmethod
+    def _map(path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def duration(self):
+        """
+        Seconds from the start of the session to its last record.
+        """
+        if len(self.index) == 0:
+            return 0.0
+        latest = self.index["timestamp"][-1]
+        for timestamp, _, _ in self.records(start=latest - self.started_at):
+            latest = max(latest, timestamp)
+        return latest - self.started_at
+
+    def seek(self, offset):
+        """
+        Returns the log offset to start reading at for records at or after
+        `offset` seconds into the session.
+        """
+        # Every record before an index entry's offset is older than its timestamp
+        position = np.searchsorted(
+            self.index["timestamp"], self.started_at + offset, side="left"
+        )
+        if position == 0:
+            return 0
+        return int(self.index["offset"][position - 1])
+
+    def records(self, start=0.0, end=None, streams=None):
+        """
+        Yields (timestamp, stream, payload) in log order, which is time order
+        up to REORDER_WINDOW. Blob payloads are bytes, inline payloads are
+        decoded JSON.
+
+        :param start: Offset into the session in seconds.
+        :param end: Offset to stop at, or None for the end of the session.
+        :param streams: Stream names to yield, or None for all.
+        """
+        wanted = None if streams is None else {STREAM_IDS[s] for s in streams}
+        start_time = self.started_at + start
+        end_time = None if end is None else self.started_at + end
+        offset = self.seek(start)
+        events = self.events
+        size = len(events)
+        while offset + RECORD_HEADER.size <= size:
+            timestamp, stream_id, flags, length = RECORD_HEADER.unpack_from(
+                events, offset
+            )
+            data_start = offset + RECORD_HEADER.size
+            offset = data_start + length
+            if offset > size:
+                # Torn write at the end of a session that did not close cleanly
+                break
+            if end_time is not None and timestamp > end_time:
+                # Records logged late may still follow
+                if timestamp > end_time + REORDER_WINDOW:
+                    break
+                continue
+            if timestamp < start_time or (
+                wanted is not None and stream_id not in wanted
+            ):
+                continue
+            if flags & FLAG_BLOB:
+                blob_offset, blob_length = BLOB_REF.unpack_from(events, data_start)
+                payload = self.blobs[blob_offset : blob_offset + blob_length]
+            else:
+                payload = json.loads(events[data_start:offset])
+            yield timestamp, self.streams[stream_id], payload
+
+    def close(self):
+        for mapped in (self.events, self.blobs):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import inspect
+import json
+import time
+import wave
+
+from emergency import EmergencyMonitor, ScreamDetector
+from fall_detection import unpack_pose_record
+from recorder import STREAMS, SessionReader
+
+
+class Replay:
+    def __init__(self, reader):
+        """
+        Feeds a recorded session back to handlers, e.g. to rerun a detector on
+        the audio and pose of a session from the field.
+
+        :param reader: SessionReader of the session.
+        """
+        self.reader = reader
+
+    async def play(self, handlers, start=0.0, end=None, speed=1.0):
+        """
+        Calls handlers[stream](timestamp, payload) for each record, keeping the
+        original spacing between records.
+
+        :param handlers: Dict of stream name to sync or async handler. Streams
+            without a handler are not read.
+        :param start: Offset into the session in seconds.
+        :param end: Offset to stop at, or None for the end of the session.
+        :param speed: Playback speed, 0 to replay as fast as possible.
+        """
+        origin = None
+        for timestamp, stream, payload in self.reader.records(
+            start=start, end=end, streams=list(handlers)
+        ):
+            if speed:
+                if origin is None:
+                    origin = (timestamp, time.monotonic())
+                due = origin[1] + (timestamp - origin[0]) / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            result = handlers[stream](timestamp, payload)
+            if inspect.isawaitable(result):
+                await result
+
+
+async def benchmark_emergency(reader, start=0.0, end=None, speed=1.0):
+    """
+    Replays the mic audio and pose results of a session through an
+    EmergencyMonitor and returns its alerts and metrics.
+
+    Record times are mapped onto the replay clock, so at `speed` 1 the alert
+    latencies are what the robot would have had live. At speed 0 audio is
+    stamped when it is fed, which leaves only the processing time.
+    """
+    monitor = EmergencyMonitor(
+        ScreamDetector(sample_rate=reader.session.get("sample_rate", 24000))
+    )
+    alerts = []
+    origin = None
+    suspected = False
+
+    def replay_time(timestamp):
+        nonlocal origin
+        if not speed:
+            return time.time()
+        if origin is None:
+            origin = (timestamp, time.time())
+        return origin[1] + (timestamp - origin[0]) / speed
+
+    def on_alert(alert):
+        # Where in the session the event happened, from the replay clock
+        offset = None
+        if speed and origin is not None:
+            offset = (
+                origin[0]
+                + (alert["detected_at"] - origin[1]) * speed
+                - reader.started_at
+            )
+        alerts.append({**alert, "offset": offset})
+
+    monitor.add_hook(on_alert)
+
+    def on_audio(timestamp, payload):
+        monitor.feed_audio(payload, captured_at=replay_time(timestamp))
+
+    def on_pose(timestamp, payload):
+        nonlocal suspected
+        # Live, the fall is reported on the frame it is first suspected on
+        fall_detected, fall_suspected = unpack_pose_record(payload)[3:]
+        if fall_suspected and not suspected:
+            monitor.report_fall(replay_time(timestamp))
+        suspected = fall_suspected or fall_detected
+
+    await Replay(reader).play(
+        {"mic_audio": on_audio, "pose": on_pose}, start=start, end=end, speed=speed
+    )
+    # Let the audio worker finish what was queued
+    while monitor.audio.qsize():
+        await asyncio.sleep(0.01)
+    monitor.close()
+    return alerts, monitor.metrics()
+
+
+def describe(payload):
+    if isinstance(payload, bytes):
+        return f"<{len(payload)} bytes>"
+    if isinstance(payload, dict) and "type" in payload:
+        return payload["type"]
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def write_wav(reader, stream, path, start, end):
+    sample_rate = reader.session.get("sample_rate", 24000)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        for _, _, payload in reader.records(start, end, streams=[stream]):
+            f.writeframes(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a recorded session")
+    parser.add_argument("session", help="Session directory")
+    parser.add_argument("--start", type=float, default=0.0, help="Offset in seconds")
+    parser.add_argument("--end", type=float, default=None, help="Offset in seconds")
+    parser.add_argument(
+        "--streams",
+        default=",".join(STREAMS),
+        help="Comma separated streams to print",
+    )
+    parser.add_argument("--wav", help="Write the mic audio to this WAV file")
+    parser.add_argument(
+        "--assistant-wav", help="Write the assistant's audio to this WAV file"
+    )
+    parser.add_argument(
+        "--benchmark-emergency",
+        action="store_true",
+        help="Replay audio and pose through the emergency detector",
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Replay speed for the benchmark"
+    )
+    args = parser.parse_args()
+
+    reader = SessionReader(args.session)
+    print(f"Session of {reader.duration:.1f} s, {len(reader.index)} index entries")
+    if args.wav:
+        write_wav(reader, "mic_audio", args.wav, args.start, args.end)
+    if args.assistant_wav:
+        write_wav(reader, "assistant_audio", args.assistant_wav, args.start, args.end)
+    if args.benchmark_emergency:
+        alerts, metrics = asyncio.run(
+            benchmark_emergency(reader, args.start, args.end, args.speed)
+        )
+        for alert in alerts:
+            offset = "" if alert["offset"] is None else f"{alert['offset']:9.3f}"
+            print(
+                f"{offset:>9} {alert['kind']:8} confirmed={alert['confirmed']} "
+                f"latency={alert['latency_ms']:.0f} ms"
+            )
+        print(metrics)
+    elif not (args.wav or args.assistant_wav):
+        for timestamp, stream, payload in reader.records(
+            args.start, args.end, streams=args.streams.split(",")
+        ):
+            print(f"{timestamp - reader.started_at:9.3f} {stream:16} {describe(payload)}")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
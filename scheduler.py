@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import time
+
+
+class Analyzer:
+    def __init__(self, name, rate, idle_rate, priority):
+        self.name = name
+        self.rate = rate
+        self.idle_rate = idle_rate
+        self.priority = priority
+        self.last_tick = 0.0
+
+
+class VisionScheduler:
+    """
+    Decides how often each vision analyzer runs.
+
+    Every analyzer has a full rate, an idle rate used when its output is not
+    needed right now, and a priority between 0 and 1. When the event loop lags
+    or the process, together with its vision worker processes, uses more CPU
+    than its budget, rates are shed, lowest priority first. Analyzers call `wait` once per processed frame instead of
+    sleeping for a fixed frame time.
+    """
+
+    def __init__(
+        self,
+        cpu_budget=0.8,
+        lag_budget=0.05,
+        fall_boost=10.0,
+        face_timeout=2.0,
+        check_interval=1.0,
+        backend=None,
+    ):
+        """
+        :param cpu_budget: Share of all cores the process may use before shedding.
+        :param lag_budget: Event loop lag in seconds that triggers shedding.
+        :param fall_boost: Seconds pose runs at full rate after a suspected fall.
+        :param face_timeout: Seconds without a face before heart rate idles.
+        :param check_interval: Seconds between load evaluations.
+        :param backend: Vision backend whose worker processes' CPU time counts
+            towards the budget, see ProcessBackend.cpu_time.
+        """
+        self.cpu_budget = cpu_budget
+        self.lag_budget = lag_budget
+        self.fall_boost = fall_boost
+        self.face_timeout = face_timeout
+        self.check_interval = check_interval
+        self.backend = backend
+        self.analyzers = {}
+        self.autonomous = False
+        self.fall_suspected_at = 0.0
+        self.face_seen_at = 0.0
+        # 0 runs everything at its target rate, 1 sheds as much as priorities allow
+        self.shed = 0.0
+        self.loop_lag = 0.0
+        self.cpu_load = 0.0
+        self.task = asyncio.create_task(self.monitor_load())
+
+    def register(self, name, rate, idle_rate, priority):
+        self.analyzers[name] = Analyzer(name, rate, idle_rate, priority)
+
+    def set_autonomous(self, autonomous):
+        self.autonomous = autonomous
+
+    def suspect_fall(self):
+        self.fall_suspected_at = time.time()
+
+    def face_seen(self):
+        self.face_seen_at = time.time()
+
+    def is_needed(self, name):
+        """
+        Whether the analyzer's output is needed at full rate right now.
+        """
+        now = time.time()
+        if name == "pose":
+            return self.autonomous or now - self.fall_suspected_at < self.fall_boost
+        if name == "heart_rate":
+            return now - self.face_seen_at < self.face_timeout
+        return True
+
+    def rate(self, name):
+        analyzer = self.analyzers[name]
+        if not self.is_needed(name):
+            return analyzer.idle_rate
+        shed_rate = analyzer.rate * (1 - self.shed * (1 - analyzer.priority))
+        return max(analyzer.idle_rate, shed_rate)
+
+    async def wait(self, name):
+        """
+        Sleeps until the analyzer's next tick.
+        """
+        analyzer = self.analyzers[name]
+        loop = asyncio.get_running_loop()
+        delay = analyzer.last_tick + 1 / self.rate(name) - loop.time()
+        await asyncio.sleep(max(0, delay))
+        analyzer.last_tick = loop.time()
+
+    def cpu_time(self):
+        """
+        CPU seconds used by this process and the backend's worker processes.
+        """
+        cpu = time.process_time()
+        if self.backend is not None:
+            cpu += self.backend.cpu_time()
+        return cpu
+
+    async def monitor_load(self):
+        """
+        Samples event loop lag and process CPU use and adjusts shedding.
+        """
+        loop = asyncio.get_running_loop()
+        cores = os.cpu_count() or 1
+        sample_interval = 0.1
+        last_wall, last_cpu = time.monotonic(), self.cpu_time()
+        while True:
+            max_lag = 0.0
+            for _ in range(round(self.check_interval / sample_interval)):
+                start = loop.time()
+                await asyncio.sleep(sample_interval)
+                max_lag = max(max_lag, loop.time() - start - sample_interval)
+
+            wall, cpu = time.monotonic(), self.cpu_time()
+            self.loop_lag = max_lag
+            # A worker that exited takes its CPU time with it
+            self.cpu_load = max(0.0, (cpu - last_cpu) / (wall - last_wall) / cores)
+            last_wall, last_cpu = wall, cpu
+
+            if self.loop_lag > self.lag_budget or self.cpu_load > self.cpu_budget:
+                if self.shed < 1.0:
+                    logging.info(
+                        f"Shedding vision load (lag {self.loop_lag * 1000:.0f} ms, "
+                        f"cpu {self.cpu_load:.0%})"
+                    )
+                self.shed = min(1.0, self.shed + 0.2)
+            elif (
+                self.loop_lag < self.lag_budget / 2
+                and self.cpu_load < self.cpu_budget * 0.8
+            ):
+                self.shed = max(0.0, self.shed - 0.1)
+
+    def metrics(self):
+        metrics = {
+            "shed": self.shed,
+            "loop_lag_ms": self.loop_lag * 1000,
+            "cpu_load": self.cpu_load,
+        }
+        for name in self.analyzers:
+            metrics[f"{name}_fps"] = self.rate(name)
+        return metrics
@@ -1,31 +1,80 @@
-import serial
-import time
-
-# Configure the serial port
-# Make sure to use the correct port name for your system
-ser = serial.Serial('/dev/ttyACM0', 9600, timeout=1)
-
-# Wait for the serial connection to initialize
-time.sleep(2)
-
-try:
-    while True:
-        # Send '0' to the Arduino
-        ser.write(b'0')
-        
-        # Read the response
-        response = ser.readline().decode('utf-8').strip()
-        
-        # Print the response
-        print(f"Received: {response}")
-        
-        # Wait a bit before sending again
-        time.sleep(1)
-
-except KeyboardInterrupt:
-    print("Program terminated by user")
-
-finally:
-    # Close the serial connection
-    ser.close()
-    print("Serial connection closed")
+import argparse
+import asyncio
+import logging
+import os
+import pty
+import random
+import threading
+import tty
+
+from telemetry import SerialTelemetry
+
+
+class FakeArduino:
+    """
+    Stands in for electronics_code.ino on a pseudo terminal, so the telemetry
+    poller can be exercised without the board.
+    """
+
+    def __init__(self, dht_error_rate=0.1):
+        self.dht_error_rate = dht_error_rate
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                requests = os.read(self.master, 64)
+            except OSError:
+                return
+            for request in requests.decode("ascii", errors="replace"):
+                if request in "\r\n":
+                    continue
+                os.write(self.master, self.respond(request).encode("ascii"))
+
+    def respond(self, request):
+        if request == "0":
+            return (
+                f"BAT raw={random.randint(700, 800)} cap={random.uniform(40, 90):.2f}\n"
+            )
+        if request == "1":
+            if random.random() < self.dht_error_rate:
+                return "DHT err=253\n"
+            return f"DHT temp={random.uniform(5, 30):.2f} hum={random.uniform(30, 80):.2f}\n"
+        return f"ERR req={ord(request)}\n"
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Poll the robot's serial board")
+    parser.add_argument("--port", default="/dev/ttyACM0")
+    parser.add_argument("--fake", action="store_true", help="use a fake board on a pty")
+    args = parser.parse_args()
+
+    fake = FakeArduino() if args.fake else None
+    telemetry = SerialTelemetry(
+        port=fake.port if fake else args.port, poll_interval=1.0
+    )
+    try:
+        while True:
+            await asyncio.sleep(1)
+            print(f"Status: {await telemetry.function({})}")
+            print(f"Metrics: {telemetry.metrics()}")
+    finally:
+        telemetry.close()
+        if fake:
+            fake.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level="INFO", format="%(message)s")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Program terminated by user")
@@ -0,0 +1,65 @@
+import time
+
+
+class StatusMonitor:
+    def __init__(self, heart_rate, pose_estimator=None, bpm_change=10):
+        """
+        Summarizes the farmer's vitals and pose for the conversation, so they
+        can be pushed to the model when they change instead of the model
+        polling for them with function calls.
+
+        :param heart_rate: HeartRateMonitor.
+        :param pose_estimator: PoseEstimator, or None without a pose camera.
+        :param bpm_change: Heart rate change in BPM that is worth reporting.
+        """
+        self.heart_rate = heart_rate
+        self.pose_estimator = pose_estimator
+        self.bpm_change = bpm_change
+        self.reported = None
+        self.reported_at = None
+        self.reports = 0
+
+    def snapshot(self):
+        bpm = self.heart_rate.latest_bpm
+        return {
+            "heart_rate": None if bpm is None else round(bpm),
+            "fall_detected": bool(
+                self.pose_estimator is not None and self.pose_estimator.fall_detected
+            ),
+        }
+
+    def changed(self, status):
+        """
+        Whether `status` differs materially from the last reported one.
+        """
+        if self.reported is None:
+            return status["heart_rate"] is not None or status["fall_detected"]
+        if status["fall_detected"] != self.reported["fall_detected"]:
+            return True
+        previous, current = self.reported["heart_rate"], status["heart_rate"]
+        if current is None:
+            return False
+        return previous is None or abs(current - previous) >= self.bpm_change
+
+    def report(self):
+        """
+        Returns the status if it should be reported, marking it reported, or
+        None if nothing changed materially.
+        """
+        status = self.snapshot()
+        if not self.changed(status):
+            return None
+        self.reported = status
+        self.reported_at = time.time()
+        self.reports += 1
+        return status
+
+    def reset(self):
+        """
+        Forgets what was reported, e.g. for a new session that has not seen it.
+        """
+        self.reported = None
+        self.reported_at = None
+
+    def metrics(self):
+        return {"reports": self.reports}
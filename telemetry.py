@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+
+import serial
+
+# Request bytes understood by electronics_code.ino
+REQ_BAT = b"0"
+REQ_DHT = b"1"
+
+
+class Tool:
+    def __init__(self, name, description, function):
+        self.name = name
+        self.description = description
+        self.function = function
+
+
+def parse_frame(line):
+    """
+    Parses one line of the board protocol, "KIND key=value key=value".
+
+    :return: (kind, {key: float}) or None for an empty line.
+    :raises ValueError: If the line is malformed.
+    """
+    parts = line.split()
+    if not parts:
+        return None
+    fields = {}
+    for part in parts[1:]:
+        key, sep, value = part.partition("=")
+        if not sep:
+            raise ValueError(f"Malformed field {part!r}")
+        fields[key] = float(value)
+    return parts[0], fields
+
+
+class SerialTelemetry(Tool):
+    def __init__(self, port="/dev/ttyACM0", baudrate=115200, poll_interval=5.0):
+        """
+        Polls the Arduino for battery and DHT11 readings in the background.
+
+        :param port: Serial port of the board.
+        :param baudrate: Baud rate, must match electronics_code.ino.
+        :param poll_interval: Seconds between polls.
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.poll_interval = poll_interval
+        self.timeout = 1.0
+        self.serial = None
+        # Latest readings by kind ("BAT", "DHT"), each with a "timestamp"
+        self.readings = {}
+        self.errors = 0
+        self.name = "get_robot_status"
+        self.description = {
+            "type": "function",
+            "name": "get_robot_status",
+            "description": "Get the robot's battery level and the temperature and humidity measured by the robot's own sensor.",
+            "parameters": {},
+        }
+        self.function = self.get_status
+        self.task = asyncio.create_task(self.poll())
+
+    async def poll(self):
+        """
+        Opens the serial port and polls the board every `poll_interval` seconds,
+        reconnecting if the board goes away.
+        """
+        while True:
+            try:
+                if self.serial is None:
+                    self.serial = await asyncio.to_thread(
+                        serial.Serial, self.port, self.baudrate, timeout=self.timeout
+                    )
+                    # The board resets when the port is opened
+                    await asyncio.sleep(2)
+                    logging.info(f"Connected to the board on {self.port}")
+
+                for request, kind in ((REQ_BAT, "BAT"), (REQ_DHT, "DHT")):
+                    await self.request(request, kind)
+            except serial.SerialException as e:
+                logging.warning(f"Serial telemetry unavailable: {e}")
+                self.close()
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def request(self, request, kind):
+        """
+        Sends a request byte and caches the matching response.
+        """
+        await asyncio.to_thread(self.serial.write, request)
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            line = await asyncio.to_thread(self.serial.readline)
+            try:
+                frame = parse_frame(line.decode("ascii", errors="replace"))
+            except ValueError as e:
+                logging.warning(f"Ignoring serial frame {line!r}: {e}")
+                continue
+            if frame is None or frame[0] != kind:
+                continue
+
+            fields = frame[1]
+            if "err" in fields:
+                self.errors += 1
+                logging.warning(f"{kind} sensor error {fields['err']:.0f}")
+            else:
+                fields["timestamp"] = time.time()
+                self.readings[kind] = fields
+            return
+
+        self.errors += 1
+        logging.warning(f"No {kind} response from the board")
+
+    def latest(self, kind, max_age=None):
+        """
+        Returns the latest reading of a kind, or None if there is none or it is
+        older than `max_age` seconds.
+        """
+        reading = self.readings.get(kind)
+        if reading is None:
+            return None
+        if max_age is not None and time.time() - reading["timestamp"] > max_age:
+            return None
+        return reading
+
+    async def get_status(self, arguments):
+        now = time.time()
+        status = {}
+        battery = self.latest("BAT")
+        if battery is not None:
+            status["battery_percent"] = round(battery["cap"], 1)
+            status["battery_age_seconds"] = round(now - battery["timestamp"])
+        environment = self.latest("DHT")
+        if environment is not None:
+            status["temperature"] = environment["temp"]
+            status["humidity"] = environment["hum"]
+            status["unit"] = "Celcius"
+            status["sensor_age_seconds"] = round(now - environment["timestamp"])
+        if not status:
+            logging.warning("No telemetry received yet.")
+            return None
+        return status
+
+    def metrics(self):
+        metrics = {"connected": self.serial is not None, "errors": self.errors}
+        for kind, reading in self.readings.items():
+            for key, value in reading.items():
+                metrics[f"{kind.lower()}_{key}"] = value
+        return metrics
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
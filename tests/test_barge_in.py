@@ -0,0 +1,73 @@
+import numpy as np
+
+from barge_in import BargeInGate
+
+SAMPLE_RATE = 24000
+FRAME = 512
+
+
+def speech(seconds, level_db, seed):
+    """
+    Speech-like noise: syllables of filtered noise with pauses between them.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    signal = np.convolve(rng.standard_normal(n), np.ones(8) / 8, mode="same")
+    syllables = (np.sin(2 * np.pi * 4 * np.arange(n) / SAMPLE_RATE) > -0.3) * 1.0
+    signal *= syllables
+    signal *= 10 ** (level_db / 20) / np.sqrt(np.mean(signal**2))
+    return signal
+
+
+def pcm(signal):
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+def run(mic_extra=None, playback_db=-6.0, coupling_db=-6.0, delay_ms=120):
+    """
+    Plays robot speech and feeds the gate a mic that hears it through the
+    room. Returns, per mic frame, whether it was passed on.
+    """
+    seconds = 8.0
+    played = speech(seconds, playback_db, seed=1)
+    delay = int(delay_ms * SAMPLE_RATE / 1000)
+    echo = np.zeros_like(played)
+    echo[delay:] = played[:-delay] * 10 ** (coupling_db / 20)
+    # A little reverberation and mic noise
+    echo += np.roll(echo, 2400) * 0.3
+    mic = echo + np.random.default_rng(2).standard_normal(len(echo)) * 1e-3
+    if mic_extra is not None:
+        mic += mic_extra
+
+    gate = BargeInGate()
+    passed = []
+    for start in range(0, len(played) - FRAME, FRAME):
+        now = start / SAMPLE_RATE
+        gate.playback(pcm(played[start : start + FRAME]), now=now)
+        passed.append(gate.passes(pcm(mic[start : start + FRAME]), True, now=now))
+    return np.array(passed)
+
+
+def test_playback_leakage_alone_is_not_sent():
+    for coupling_db in (-20.0, -6.0, 0.0):
+        assert not run(coupling_db=coupling_db).any()
+
+
+def test_quiet_playback_does_not_open_the_gate():
+    assert not run(playback_db=-30.0, coupling_db=0.0).any()
+
+
+def test_user_talking_over_the_robot_opens_the_gate():
+    user = np.zeros(int(8.0 * SAMPLE_RATE))
+    start = int(5.0 * SAMPLE_RATE)
+    user[start:] = speech(3.0, -10.0, seed=3)
+    passed = run(mic_extra=user, coupling_db=-20.0)
+    first = np.argmax(passed) * FRAME / SAMPLE_RATE
+    assert passed.any()
+    # The first frame containing the user, or one shortly after
+    assert 5.0 - FRAME / SAMPLE_RATE <= first < 5.3
+
+
+def test_everything_is_sent_while_the_robot_is_quiet():
+    gate = BargeInGate()
+    assert gate.passes(pcm(np.zeros(FRAME)), playing=False)
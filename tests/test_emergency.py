@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+
+from emergency import AlertRelay, EmergencyMonitor
+
+
+def alert(kind="scream", confirmed=False, age=0.0):
+    return {
+        "kind": kind,
+        "confirmed": confirmed,
+        "detected_at": time.time() - age,
+        "latency_ms": 0.0,
+    }
+
+
+def test_failing_alert_hook_is_logged(caplog):
+    async def run():
+        monitor = EmergencyMonitor()
+
+        async def failing(alert):
+            raise ConnectionError("websocket closed")
+
+        monitor.add_hook(failing)
+        monitor.report("scream", time.time())
+        await asyncio.sleep(0.05)
+        monitor.close()
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(run())
+    failures = [r for r in caplog.records if r.message == "Emergency hook failed"]
+    assert len(failures) == 1
+    assert isinstance(failures[0].exc_info[1], ConnectionError)
+
+
+def test_alerts_without_a_session_are_sent_once_one_is_attached():
+    sent = []
+
+    async def send(alert):
+        sent.append(alert)
+
+    async def run():
+        monitor = EmergencyMonitor()
+        relay = AlertRelay()
+        monitor.add_hook(relay)
+        monitor.report("fall", time.time())
+        await asyncio.sleep(0.05)
+        assert sent == []
+        await relay.attach(send)
+        monitor.report("scream", time.time())
+        await asyncio.sleep(0.05)
+        monitor.close()
+
+    asyncio.run(run())
+    assert [alert["kind"] for alert in sent] == ["fall", "scream"]
+    assert sent[1]["confirmed"]
+
+
+def test_failed_sends_are_retried_on_the_next_session():
+    sent = []
+
+    async def broken(alert):
+        raise ConnectionError("websocket closed")
+
+    async def send(alert):
+        sent.append(alert)
+
+    async def run():
+        relay = AlertRelay()
+        await relay.attach(broken)
+        try:
+            await relay(alert("fall"))
+        except ConnectionError:
+            pass
+        relay.detach()
+        await relay(alert("scream"))
+        await relay.attach(send)
+
+    asyncio.run(run())
+    # Only the latest is sent, it carries whether any held alert was confirmed
+    assert len(sent) == 1
+    assert sent[0]["kind"] == "scream"
+
+
+def test_stale_held_alerts_are_dropped():
+    sent = []
+
+    async def send(alert):
+        sent.append(alert)
+
+    async def run():
+        relay = AlertRelay(max_age=60)
+        await relay(alert(age=120))
+        await relay.attach(send)
+
+    asyncio.run(run())
+    assert sent == []
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from fall_detection import (
+    LEFT_HIP,
+    LEFT_SHOULDER,
+    NUM_LANDMARKS,
+    RIGHT_HIP,
+    RIGHT_SHOULDER,
+    FallDetector,
+    LandmarkHistory,
+)
+
+# Pose rates the scheduler runs at: idle, followed and with a fall suspected
+RATES = [5, 10, 15, 30]
+
+
+def pose(hip_y, angle):
+    """
+    Landmarks of a torso 0.3 of the frame long, with its hips at `hip_y` and
+    tilted `angle` degrees from vertical.
+    """
+    landmarks = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[:, 3] = 1.0
+    hip = np.array([0.5, hip_y])
+    direction = np.array([np.sin(np.radians(angle)), -np.cos(np.radians(angle))])
+    shoulder = hip + 0.3 * direction
+    landmarks[[LEFT_HIP, RIGHT_HIP], :2] = hip
+    landmarks[[LEFT_SHOULDER, RIGHT_SHOULDER], :2] = shoulder
+    return landmarks
+
+
+def run(rate, duration, drop=0.25, end_angle=90.0, still=3.0):
+    """
+    Feeds 1 s of standing, a movement of `duration` seconds dropping the hips
+    by `drop` while the torso tilts to `end_angle`, then `still` seconds of
+    lying still. Returns whether a fall was detected.
+    """
+    detector = FallDetector()
+    history = LandmarkHistory(capacity=90)
+    # Start at an arbitrary phase so frames do not line up with the movement
+    t = 0.037
+    while t < 1.0 + duration + still:
+        progress = np.clip((t - 1.0) / duration, 0.0, 1.0)
+        history.append(pose(0.55 + drop * progress, end_angle * progress), t)
+        fall_detected, _ = detector.update(history)
+        if fall_detected:
+            return True
+        t += 1 / rate
+    return False
+
+
+@pytest.mark.parametrize("rate", RATES)
+@pytest.mark.parametrize("duration", [0.3, 0.4, 0.5])
+def test_fast_fall_is_detected_at_every_pose_rate(rate, duration):
+    assert run(rate, duration)
+
+
+@pytest.mark.parametrize("rate", RATES)
+def test_slowly_lying_down_is_not_a_fall(rate):
+    assert not run(rate, duration=3.0)
+
+
+@pytest.mark.parametrize("rate", RATES)
+def test_bending_over_is_not_a_fall(rate):
+    assert not run(rate, duration=0.4, drop=0.05, end_angle=70.0)
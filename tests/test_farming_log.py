@@ -0,0 +1,65 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from farming_log import FarmingLog, tokenize
+
+
+def test_particles_are_stripped_down_to_a_single_syllable():
+    assert "콩" in tokenize("콩을 심었다")
+    assert "벼" in tokenize("벼를 베었다")
+    assert tokenize("딸기에") == tokenize("딸기를") == tokenize("딸기")
+
+
+def test_search_finds_single_syllable_crops(tmp_path):
+    async def run():
+        log = FarmingLog(str(tmp_path / "farming_log.db"))
+        for text in ["콩을 심었다", "팥을 거뒀다", "오이 수확", "딸기에 물을 줬다"]:
+            await asyncio.wrap_future(log.append(text, []))
+        try:
+            return [
+                [text for *_, text in await log.search(query, limit=1)]
+                for query in ["콩", "팥", "오이", "딸기"]
+            ]
+        finally:
+            await log.close()
+
+    assert asyncio.run(run()) == [
+        ["콩을 심었다"],
+        ["팥을 거뒀다"],
+        ["오이 수확"],
+        ["딸기에 물을 줬다"],
+    ]
+
+
+def test_interrupted_migration_is_rolled_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "farming_log.db")
+
+    async def close(log):
+        await log.close()
+
+    create_search_index = FarmingLog._create_search_index
+
+    def interrupted(self, conn):
+        create_search_index(self, conn)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(FarmingLog, "_create_search_index", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        FarmingLog(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert not conn.execute(
+        "SELECT name FROM sqlite_master WHERE name = 'postings'"
+    ).fetchall()
+    conn.close()
+
+    monkeypatch.undo()
+    log = FarmingLog(path)
+    asyncio.run(close(log))
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(
+        FarmingLog.MIGRATIONS
+    )
+    conn.close()
@@ -0,0 +1,85 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+
+from heart_rate import HeartRateMonitor
+
+
+def monitor(path):
+    """
+    A monitor with only the snapshot state, without a camera or models.
+    """
+    monitor = HeartRateMonitor.__new__(HeartRateMonitor)
+    monitor.snapshot_path = str(path)
+    monitor.snapshot_max_age = 120
+    monitor.snapshot_max_gap = 5
+    monitor.latest_bpm = None
+    monitor.green_channel_values = []
+    monitor.sample_times = []
+    monitor.last_update_time = 0.0
+    return monitor
+
+
+def snapshot(**overrides):
+    now = time.time()
+    values = {
+        "saved_at": now,
+        "latest_bpm": 72.0,
+        "green_channel_values": np.arange(3.0),
+        "sample_times": now - np.arange(3.0)[::-1],
+        "last_update_time": now,
+    }
+    values.update(overrides)
+    return values
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "snapshot.npz"
+    monitor(path)._write_snapshot(snapshot())
+    resumed = monitor(path)
+    resumed.load_snapshot()
+    assert resumed.latest_bpm == 72.0
+    assert resumed.green_channel_values == [0.0, 1.0, 2.0]
+
+
+def test_missing_snapshot_starts_cold(tmp_path, caplog):
+    cold = monitor(tmp_path / "snapshot.npz")
+    with caplog.at_level(logging.WARNING):
+        cold.load_snapshot()
+    assert cold.latest_bpm is None
+    assert not caplog.records
+
+
+def write_empty(path):
+    path.write_bytes(b"")
+
+
+def write_truncated(path):
+    monitor(path)._write_snapshot(snapshot())
+    path.write_bytes(path.read_bytes()[:100])
+
+
+def write_missing_key(path):
+    values = snapshot()
+    del values["sample_times"]
+    np.savez(path, **values)
+
+
+def write_garbage(path):
+    path.write_bytes(b"not a snapshot" * 10)
+
+
+@pytest.mark.parametrize(
+    "write", [write_empty, write_truncated, write_missing_key, write_garbage]
+)
+def test_damaged_snapshot_starts_cold(tmp_path, caplog, write):
+    path = tmp_path / "snapshot.npz"
+    write(path)
+    cold = monitor(path)
+    with caplog.at_level(logging.WARNING):
+        cold.load_snapshot()
+    assert cold.latest_bpm is None
+    assert cold.green_channel_values == []
+    assert "Ignoring heart rate snapshot" in caplog.text
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from keyword_matcher import KeywordMatcher
+
+VOCABULARY_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, "farming_vocabulary.json"
+)
+
+VOCABULARY = {
+    "crop": ["가지", "호박", "애호박", "토마토", "방울토마토"],
+    "task": ["가지치기", "수확"],
+    "input": ["퇴비"],
+    "soil": ["퇴비"],
+}
+
+
+def test_terms_inside_longer_terms_are_not_matched():
+    matcher = KeywordMatcher(VOCABULARY)
+    assert matcher.find("오늘 가지치기 했어") == [("가지치기", "task")]
+    assert matcher.find("애호박 수확") == [("애호박", "crop"), ("수확", "task")]
+
+
+def test_separate_occurrences_of_a_shorter_term_are_matched():
+    matcher = KeywordMatcher(VOCABULARY)
+    assert matcher.find("방울토마토랑 토마토") == [
+        ("방울토마토", "crop"),
+        ("토마토", "crop"),
+    ]
+
+
+def test_a_term_in_several_categories_is_matched_in_each():
+    matcher = KeywordMatcher(VOCABULARY)
+    assert matcher.find("퇴비를 줬다") == [("퇴비", "input"), ("퇴비", "soil")]
+
+
+def test_terms_inside_other_words_are_not_matched():
+    matcher = KeywordMatcher(VOCABULARY)
+    assert matcher.find("목수확인") == []
+    assert matcher.find("오늘 수확했어") == [("수확", "task")]
+
+
+def test_whole_word_terms_may_only_be_followed_by_a_particle():
+    matcher = KeywordMatcher({"crop": ["사과$"]})
+    assert matcher.find("사과를 땄다") == [("사과", "crop")]
+    assert matcher.find("사과") == [("사과", "crop")]
+    assert matcher.find("동생한테 사과했어") == []
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "이거 가지고 와",
+        "몇 가지 물어볼게",
+        "동생이랑 밥 먹었어",
+        "정식으로 인사할게",
+        "친구한테 사과했어",
+        "그게 목적과 달라",
+    ],
+)
+def test_everyday_speech_is_not_tagged(text):
+    assert KeywordMatcher.from_file(VOCABULARY_PATH).find(text) == []
+
+
+@pytest.mark.parametrize(
+    "text, match",
+    [
+        ("가지치기를 했어", ("가지치기", "task")),
+        ("사과를 땄어", ("사과", "crop")),
+        ("딸기밭에 물주기", ("딸기", "crop")),
+        ("오늘 진딧물이 많아", ("진딧물", "pest")),
+    ],
+)
+def test_farming_speech_is_tagged(text, match):
+    assert match in KeywordMatcher.from_file(VOCABULARY_PATH).find(text)
@@ -0,0 +1,69 @@
+import time
+
+from recorder import SessionReader, SessionRecorder
+
+
+def record_session(path):
+    """
+    Records 10 s of audio every 20 ms and pose results at 10 fps, the pose
+    results logged 150 ms after the capture time they are stamped with.
+    """
+    recorder = SessionRecorder(path, index_interval=0.5)
+    start = recorder.started_at
+    expected = []
+    pending_poses = []
+    for i in range(500):
+        now = start + i * 0.02
+        recorder.record("mic_audio", bytes(960), timestamp=now)
+        expected.append((now, "mic_audio"))
+        if i % 5 == 0:
+            pending_poses.append(now)
+        while pending_poses and pending_poses[0] <= now - 0.15:
+            captured_at = pending_poses.pop(0)
+            recorder.record("pose", {"frame": captured_at}, timestamp=captured_at)
+            expected.append((captured_at, "pose"))
+    recorder.close()
+    return start, expected
+
+
+def test_range_reads_include_records_logged_late(tmp_path):
+    start, expected = record_session(tmp_path)
+    reader = SessionReader(tmp_path)
+    for begin, end in [(0.0, 1.0), (1.03, 2.5), (4.99, 5.0), (7.4, None)]:
+        got = [
+            (timestamp, stream)
+            for timestamp, stream, _ in reader.records(begin, end)
+        ]
+        wanted = [
+            (timestamp, stream)
+            for timestamp, stream in expected
+            if timestamp >= start + begin
+            and (end is None or timestamp <= start + end)
+        ]
+        assert sorted(got) == sorted(wanted)
+    reader.close()
+
+
+def test_failed_write_does_not_shift_later_records(tmp_path):
+    recorder = SessionRecorder(tmp_path)
+    start = recorder.started_at
+    write = recorder.events.write
+    failures = [OSError("disk full")]
+
+    def flaky_write(data):
+        if failures:
+            raise failures.pop()
+        return write(data)
+
+    recorder.events.write = flaky_write
+    recorder.record("server_event", {"lost": True}, timestamp=start + 1)
+    while recorder.dropped == 0:
+        time.sleep(0.001)
+    recorder.record("server_event", {"n": 2}, timestamp=start + 2)
+    recorder.record("mic_audio", b"audio", timestamp=start + 3)
+    recorder.close()
+
+    reader = SessionReader(tmp_path)
+    assert [payload for _, _, payload in reader.records()] == [{"n": 2}, b"audio"]
+    assert [payload for _, _, payload in reader.records(2.5)] == [b"audio"]
+    reader.close()
@@ -0,0 +1,44 @@
+import asyncio
+import os
+import time
+
+from scheduler import VisionScheduler
+
+
+class BusyWorkers:
+    """
+    Backend whose worker processes keep every core busy.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+
+    def cpu_time(self):
+        return (time.monotonic() - self.started) * (os.cpu_count() or 1)
+
+
+def test_worker_cpu_counts_towards_the_budget():
+    async def run():
+        scheduler = VisionScheduler(check_interval=0.2, backend=BusyWorkers())
+        scheduler.register("pose", rate=30, idle_rate=5, priority=0.8)
+        await asyncio.sleep(0.5)
+        scheduler.task.cancel()
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert scheduler.cpu_load > scheduler.cpu_budget
+    assert scheduler.shed > 0
+
+
+def test_idle_workers_do_not_shed():
+    class IdleWorkers:
+        def cpu_time(self):
+            return 0.0
+
+    async def run():
+        scheduler = VisionScheduler(check_interval=0.2, backend=IdleWorkers())
+        await asyncio.sleep(0.5)
+        scheduler.task.cancel()
+        return scheduler
+
+    assert asyncio.run(run()).shed == 0
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+
+from vision_backend import ProcessBackend, ThreadBackend
+
+
+class Mean:
+    """
+    Model returning the image mean. An image starting with 255 makes it
+    exit the worker process, one starting with 254 makes it slow.
+    """
+
+    def __call__(self, image):
+        if image.flat[0] == 255:
+            os._exit(1)
+        if image.flat[0] == 254:
+            time.sleep(0.2)
+        return float(image.mean())
+
+
+def image(value):
+    return np.full((8, 8, 3), value, dtype=np.uint8)
+
+
+def test_results_come_back_in_order_of_request():
+    async def run():
+        backend = ProcessBackend(max_image_shape=(8, 8, 3), slots=2)
+        await backend.preload({"mean": Mean})
+        try:
+            return await asyncio.gather(
+                *(backend.process("mean", image(i)) for i in range(10))
+            )
+        finally:
+            backend.close()
+
+    assert asyncio.run(run()) == list(range(10))
+
+
+def test_calls_fail_instead_of_hanging_after_the_worker_exits():
+    async def run():
+        backend = ProcessBackend(max_image_shape=(8, 8, 3), slots=2)
+        await backend.preload({"mean": Mean})
+        try:
+            # More calls than slots, so some wait for a slot when it exits
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    backend.process("mean", image(255)),
+                    *(backend.process("mean", image(1)) for _ in range(4)),
+                    return_exceptions=True,
+                ),
+                timeout=5,
+            )
+            assert all(isinstance(result, RuntimeError) for result in results)
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(backend.process("mean", image(1)), timeout=1)
+        finally:
+            backend.close()
+
+    asyncio.run(run())
+
+
+def test_cancelled_calls_give_their_slot_back():
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context)
+        )
+        backend = ProcessBackend(max_image_shape=(8, 8, 3), slots=1)
+        await backend.preload({"mean": Mean})
+        try:
+            slow = asyncio.create_task(backend.process("mean", image(254)))
+            await asyncio.sleep(0.05)
+            slow.cancel()
+            return await asyncio.wait_for(backend.process("mean", image(3)), timeout=5)
+        finally:
+            backend.close()
+
+    assert asyncio.run(run()) == 3.0
+    # The slow result arriving for the cancelled call is dropped quietly
+    assert errors == []
+
+
+class Busy:
+    """
+    Model spinning the CPU for 0.2 s.
+    """
+
+    def __call__(self, image):
+        end = time.process_time() + 0.2
+        while time.process_time() < end:
+            pass
+        return None
+
+
+def test_worker_cpu_time_is_counted():
+    async def run():
+        backend = ProcessBackend(max_image_shape=(8, 8, 3), slots=1)
+        await backend.preload({"busy": Busy})
+        try:
+            before = backend.cpu_time()
+            await backend.process("busy", image(0))
+            return backend.cpu_time() - before
+        finally:
+            backend.close()
+
+    assert asyncio.run(run()) >= 0.15
+
+
+class Corner:
+    """
+    Model returning the shape of the image it is fed and its top left pixel.
+    """
+
+    def __call__(self, image):
+        return image.shape, tuple(int(v) for v in image[0, 0])
+
+
+def bgr_frame():
+    frame = np.zeros((40, 80, 3), dtype=np.uint8)
+    frame[..., 0] = 255  # blue
+    return frame
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_frames_are_converted_and_resized_by_the_backend(kind):
+    async def run():
+        if kind == "process":
+            backend = ProcessBackend(max_image_shape=(40, 80, 3), slots=1)
+        else:
+            backend = ThreadBackend()
+        await backend.preload({"corner": Corner})
+        try:
+            frame = bgr_frame()
+            return (
+                await backend.process("corner", frame, width=40),
+                await backend.process("corner", frame, width=160),
+                await backend.process("corner", frame[10:30, 20:40], size=(8, 8)),
+            )
+        finally:
+            backend.close()
+
+    scaled, unscaled, crop = asyncio.run(run())
+    assert scaled == ((20, 40, 3), (0, 0, 255))
+    assert unscaled == ((40, 80, 3), (0, 0, 255))
+    assert crop == ((8, 8, 3), (0, 0, 255))
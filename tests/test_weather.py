@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+
+import pytest
+from aiohttp import web
+
+from weather import ForecastProvider, OpenMeteoProvider, Weather
+
+
+class ForecastStandIn:
+    """
+    Local stand-in for the Open-Meteo geocoding and forecast APIs, counting
+    upstream calls. The forecast answers slowly, and the temperature goes up
+    by one on every call so refreshes are visible.
+    """
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.geocode_calls = 0
+        self.forecast_calls = 0
+        self.failing = False
+        app = web.Application()
+        app.router.add_get("/v1/search", self.geocode)
+        app.router.add_get("/v1/forecast", self.forecast)
+        self.runner = web.AppRunner(app)
+
+    async def start(self):
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def geocode(self, request):
+        self.geocode_calls += 1
+        if request.query["name"] == "Atlantis":
+            return web.json_response({})
+        return web.json_response(
+            {"results": [{"latitude": 36.35, "longitude": 127.38}]}
+        )
+
+    async def forecast(self, request):
+        self.forecast_calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failing:
+            return web.Response(status=503)
+        return web.json_response(
+            {
+                "current": {
+                    "temperature_2m": 4.0 + self.forecast_calls,
+                    "relative_humidity_2m": 50,
+                    "precipitation": 0.0,
+                    "wind_speed_10m": 3.2,
+                },
+                "daily": {
+                    "temperature_2m_max": [9.0],
+                    "temperature_2m_min": [-1.0],
+                    "precipitation_probability_max": [10],
+                },
+            }
+        )
+
+
+class Telemetry:
+    def __init__(self, reading):
+        self.reading = reading
+
+    def latest(self, kind, max_age):
+        return self.reading
+
+
+def run_with_stand_in(test, **weather_kwargs):
+    async def run():
+        stand_in = ForecastStandIn()
+        base_url = await stand_in.start()
+        weather = Weather(
+            provider=OpenMeteoProvider(base_url=base_url, geocoding_url=base_url),
+            **weather_kwargs,
+        )
+        try:
+            await test(weather, stand_in)
+        finally:
+            await stand_in.runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_forecast_provider_is_abstract():
+    with pytest.raises(TypeError):
+        ForecastProvider()
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    async def test(weather, stand_in):
+        results = await asyncio.gather(*(weather.function("{}") for _ in range(10)))
+        assert stand_in.geocode_calls == 1
+        assert stand_in.forecast_calls == 1
+        assert all(result == results[0] for result in results)
+        assert results[0]["location"] == "Daejeon"
+        assert results[0]["forecast"] == {
+            "temperature": 5.0,
+            "humidity": 50,
+            "precipitation": 0.0,
+            "wind_speed": 3.2,
+            "temperature_max": 9.0,
+            "temperature_min": -1.0,
+            "precipitation_probability": 10,
+        }
+        assert weather.cache.metrics()["misses"] == 10
+
+    run_with_stand_in(test)
+
+
+def test_stale_forecast_is_served_while_it_refreshes():
+    async def test(weather, stand_in):
+        weather.cache.ttl = 0.5
+        await weather.function("{}")
+        await asyncio.sleep(0.6)
+
+        start = time.perf_counter()
+        stale = await weather.function("{}")
+        assert time.perf_counter() - start < stand_in.delay
+        assert stale["forecast"]["temperature"] == 5.0
+
+        await asyncio.sleep(stand_in.delay * 2)
+        fresh = await weather.function("{}")
+        assert fresh["forecast"]["temperature"] == 6.0
+        assert stand_in.geocode_calls == 1
+        assert weather.cache.metrics()["stale_hits"] == 1
+
+    run_with_stand_in(test)
+
+
+def test_failed_refresh_keeps_the_cached_forecast():
+    async def test(weather, stand_in):
+        weather.cache.ttl = 0
+        await weather.function("{}")
+        stand_in.failing = True
+        assert (await weather.function("{}"))["forecast"]["temperature"] == 5.0
+        await asyncio.sleep(stand_in.delay * 2)
+        assert (await weather.function("{}"))["forecast"]["temperature"] == 5.0
+
+    run_with_stand_in(test)
+
+
+def test_unknown_location_still_reports_the_field_sensor():
+    reading = {"temp": 21.0, "hum": 63.0, "timestamp": time.time()}
+
+    async def test(weather, stand_in):
+        data = await weather.function(json.dumps({"location": "Atlantis"}))
+        assert "forecast" not in data
+        assert data["field_sensor"] == {
+            "temperature": 21.0,
+            "humidity": 63.0,
+            "age_seconds": 0,
+        }
+
+    run_with_stand_in(test, telemetry=Telemetry(reading))
@@ -0,0 +1,374 @@
+import asyncio
+import atexit
+import logging
+import multiprocessing as mp_process
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from fall_detection import landmarks_to_array
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def prepare_image(bgr, width=None, size=None):
+    """
+    Turns a camera frame, or a crop of one, into the RGB image a model is fed.
+    Called on the backend's worker thread or process, never on the event loop.
+
+    :param width: Downscale to this width keeping the aspect ratio, images
+        that are narrower are left as they are.
+    :param size: Resize to this (width, height) instead.
+    """
+    h, w, _ = bgr.shape
+    if size is None and width is not None and w > width:
+        size = (width, round(h * width / w))
+    # Resizing first leaves fewer pixels to convert
+    if size is not None and tuple(size) != (w, h):
+        bgr = cv2.resize(bgr, tuple(size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+
+class PoseModel:
+    """
+    MediaPipe Pose returning compact arrays: (landmarks, world_landmarks), both
+    (33, 4) float32, or None when nobody is found.
+    """
+
+    def __init__(self):
+        import mediapipe as mp
+
+        self.pose = mp.solutions.pose.Pose(
+            min_detection_confidence=0.5, min_tracking_confidence=0.5
+        )
+
+    def __call__(self, rgb):
+        results = self.pose.process(rgb)
+        if not results.pose_landmarks:
+            return None
+        world_landmarks = None
+        if results.pose_world_landmarks:
+            world_landmarks = landmarks_to_array(results.pose_world_landmarks)
+        return landmarks_to_array(results.pose_landmarks), world_landmarks
+
+
+class FaceMeshModel:
+    """
+    MediaPipe FaceMesh returning only the requested landmarks as a (n, 2)
+    float32 array of normalized x, y, or None when no face is found.
+    """
+
+    def __init__(self, points):
+        import mediapipe as mp
+
+        self.points = points
+        self.face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=False, max_num_faces=1, min_detection_confidence=0.5
+        )
+
+    def __call__(self, rgb):
+        results = self.face_mesh.process(rgb)
+        if not results.multi_face_landmarks:
+            return None
+        landmarks = results.multi_face_landmarks[0].landmark
+        return np.array(
+            [(landmarks[i].x, landmarks[i].y) for i in self.points], dtype=np.float32
+        )
+
+
+class ThreadBackend:
+    """
+    Runs every model in this process, each on its own worker thread so the
+    event loop stays free while a model runs.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.executors = {}
+
+    def add_model(self, name, factory):
+        """
+        Creates a model unless one is already processed under `name`, so
+        consumers created again after a session restart reuse it.
+
+        :param name: Name the model is processed under.
+        :param factory: Picklable callable creating the model, e.g. PoseModel.
+        """
+        if name in self.models:
+            return
+        self.models[name] = factory()
+        # MediaPipe graphs must not process two images at once
+        self.executors[name] = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"vision-{name}"
+        )
+
+    async def preload(self, models):
+        """
+        Creates models on worker threads, side by side and without blocking
+        the event loop.
+
+        :param models: Dict of name to factory, as passed to add_model.
+        """
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(self.add_model, name, factory)
+                for name, factory in models.items()
+            )
+        )
+
+    async def process(self, name, bgr, width=None, size=None):
+        """
+        Runs a model on a BGR image, converted as by prepare_image on the
+        model's worker thread.
+        """
+        model = self.models[name]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executors[name], lambda: model(prepare_image(bgr, width, size))
+        )
+
+    def cpu_time(self):
+        """
+        CPU seconds used outside this process, none as the models run on its
+        threads.
+        """
+        return 0.0
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+
+
+def _worker_main(factory, shm_name, slot_size, conn):
+    """
+    Entry point of a model worker process. Reports when the model is loaded,
+    then receives (slot, shape, options) requests, runs the model on the BGR
+    image in that shared memory slot, prepared with the options, and sends the
+    result back.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    model = factory()
+    conn.send((None, None, None))
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            slot, shape, options = request
+            image = np.ndarray(
+                shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_size
+            )
+            try:
+                conn.send((slot, model(prepare_image(image, **options)), None))
+            except Exception as e:
+                conn.send((slot, None, repr(e)))
+            del image
+    finally:
+        shm.close()
+
+
+class ProcessWorker:
+    def __init__(self, name, factory, max_image_shape, slots, context):
+        self.name = name
+        self.slot_size = int(np.prod(max_image_shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_size * slots)
+        self.free_slots = list(range(slots))
+        self.slot_available = asyncio.Semaphore(slots)
+        self.pending = {}  # slot -> asyncio.Future
+        self.error = None  # set once the worker has exited
+        self.loop = asyncio.get_running_loop()
+        self.ready = self.loop.create_future()
+        self.conn, child_conn = context.Pipe()
+        self.worker_process = context.Process(
+            target=_worker_main,
+            args=(factory, self.shm.name, self.slot_size, child_conn),
+            name=f"vision-{name}",
+            daemon=True,
+        )
+        self.worker_process.start()
+        child_conn.close()
+        self.loop.add_reader(self.conn.fileno(), self.on_result)
+
+    def on_result(self):
+        try:
+            slot, result, error = self.conn.recv()
+        except (EOFError, OSError):
+            self.loop.remove_reader(self.conn.fileno())
+            logging.error(f"Vision worker {self.name} exited")
+            self.error = RuntimeError(f"{self.name} worker exited")
+            for future in [self.ready, *self.pending.values()]:
+                if not future.done():
+                    future.set_exception(self.error)
+            # Wake callers waiting for a slot, they see the error and raise
+            for slot in list(self.pending):
+                self.release_slot(slot)
+            return
+        if slot is None:
+            self.ready.set_result(None)
+            return
+        future = self.release_slot(slot)
+        # The caller may have been cancelled while the model ran
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(f"{self.name} worker failed: {error}"))
+        else:
+            future.set_result(result)
+
+    def release_slot(self, slot):
+        future = self.pending.pop(slot)
+        self.free_slots.append(slot)
+        self.slot_available.release()
+        return future
+
+    async def process(self, image, options):
+        if image.nbytes > self.slot_size:
+            raise ValueError(
+                f"Image of shape {image.shape} does not fit a {self.name} slot"
+            )
+        if self.error is not None:
+            raise self.error
+        await self.slot_available.acquire()
+        if self.error is not None:
+            self.slot_available.release()
+            raise self.error
+        slot = self.free_slots.pop()
+        # The only copy of the frame: straight into shared memory, never
+        # pickled. Crops are copied from their strided view the same way
+        view = np.ndarray(
+            image.shape,
+            dtype=np.uint8,
+            buffer=self.shm.buf,
+            offset=slot * self.slot_size,
+        )
+        view[...] = image
+        del view
+        future = self.loop.create_future()
+        self.pending[slot] = future
+        try:
+            self.conn.send((slot, image.shape, options))
+        except (BrokenPipeError, OSError) as e:
+            self.release_slot(slot)
+            raise RuntimeError(f"{self.name} worker exited") from e
+        return await future
+
+    def cpu_time(self):
+        """
+        CPU seconds the worker process has used, from /proc. 0 where there is
+        no /proc or once the worker has exited.
+        """
+        try:
+            with open(f"/proc/{self.worker_process.pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            return 0.0
+        # Fields after the parenthesized command name, utime and stime are
+        # the 14th and 15th of the whole line
+        fields = stat[stat.rindex(")") + 2 :].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def close(self):
+        if self.worker_process.is_alive():
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.worker_process.join(timeout=2)
+            if self.worker_process.is_alive():
+                self.worker_process.terminate()
+        try:
+            self.loop.remove_reader(self.conn.fileno())
+        except (ValueError, RuntimeError):
+            pass
+        self.conn.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ProcessBackend:
+    """
+    Runs each model in its own worker process so the models and the Python
+    code around them do not share a GIL.
+
+    Images are passed through shared memory slots, only the compact landmark
+    arrays are pickled on the way back.
+    """
+
+    def __init__(self, max_image_shape=(720, 1280, 3), slots=2):
+        """
+        :param max_image_shape: Largest image that will be processed.
+        :param slots: Images each model may have in flight.
+        """
+        self.max_image_shape = max_image_shape
+        self.slots = slots
+        # Spawn rather than fork, MediaPipe and OpenCV keep threads around
+        self.context = mp_process.get_context("spawn")
+        self.workers = {}
+        atexit.register(self.close)
+
+    def add_model(self, name, factory):
+        """
+        Starts a worker unless one already processes `name`, so consumers
+        created again after a session restart reuse it.
+
+        :param name: Name the model is processed under.
+        :param factory: Picklable callable creating the model, e.g. PoseModel.
+        """
+        if name in self.workers:
+            return
+        self.workers[name] = ProcessWorker(
+            name, factory, self.max_image_shape, self.slots, self.context
+        )
+
+    async def preload(self, models):
+        """
+        Starts the workers and waits until each has loaded its model, they
+        load side by side.
+
+        :param models: Dict of name to factory, as passed to add_model.
+        """
+        for name, factory in models.items():
+            self.add_model(name, factory)
+        await asyncio.gather(*(self.workers[name].ready for name in models))
+
+    async def process(self, name, bgr, width=None, size=None):
+        """
+        Runs a model on a BGR image, converted as by prepare_image in the
+        model's worker process.
+        """
+        return await self.workers[name].process(bgr, {"width": width, "size": size})
+
+    def cpu_time(self):
+        """
+        CPU seconds used by the worker processes, which time.process_time
+        does not include.
+        """
+        return sum(worker.cpu_time() for worker in self.workers.values())
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.close()
+        self.workers.clear()
+
+
+# Backends live as long as the process, so their models outlive sessions
+_backends = {}
+
+
+def create_backend(kind="thread"):
+    """
+    Returns the process-wide backend of a kind, creating it on first use.
+
+    :param kind: "thread" to run models in this process, "process" to run
+        each in its own worker process.
+    """
+    if kind not in _backends:
+        if kind == "process":
+            logging.info("Running vision models in worker processes")
+            _backends[kind] = ProcessBackend()
+        else:
+            _backends[kind] = ThreadBackend()
+    return _backends[kind]
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+
+import aiohttp
+
+
+class Tool:
+    def __init__(self, name, description, function):
+        self.name = name
+        self.description = description
+        self.function = function
+
+
+class ForecastProvider(ABC):
+    """
+    Source of forecasts for a named location.
+    """
+
+    @abstractmethod
+    async def fetch(self, location):
+        """
+        Returns the current weather and today's forecast for `location`.
+        """
+
+
+class OpenMeteoProvider(ForecastProvider):
+    def __init__(
+        self,
+        base_url="https://api.open-meteo.com",
+        geocoding_url="https://geocoding-api.open-meteo.com",
+        timeout=5.0,
+    ):
+        """
+        Forecasts from Open-Meteo, which needs no API key.
+
+        :param base_url: Forecast API root, overridable for a local stand-in.
+        :param geocoding_url: Geocoding API root, overridable for a local stand-in.
+        :param timeout: Total timeout of one fetch in seconds.
+        """
+        self.base_url = base_url
+        self.geocoding_url = geocoding_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.coordinates = {}
+
+    async def fetch(self, location):
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            if location not in self.coordinates:
+                async with session.get(
+                    f"{self.geocoding_url}/v1/search",
+                    params={"name": location, "count": 1, "language": "ko"},
+                ) as response:
+                    response.raise_for_status()
+                    results = (await response.json()).get("results")
+                if not results:
+                    raise LookupError(f"Unknown location {location!r}")
+                self.coordinates[location] = (
+                    results[0]["latitude"],
+                    results[0]["longitude"],
+                )
+
+            latitude, longitude = self.coordinates[location]
+            async with session.get(
+                f"{self.base_url}/v1/forecast",
+                params={
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "current": "temperature_2m,relative_humidity_2m,precipitation,wind_speed_10m",
+                    "daily": "temperature_2m_max,temperature_2m_min,precipitation_probability_max",
+                    "forecast_days": 1,
+                    "timezone": "auto",
+                },
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+
+        current = data["current"]
+        daily = data["daily"]
+        return {
+            "temperature": current["temperature_2m"],
+            "humidity": current["relative_humidity_2m"],
+            "precipitation": current["precipitation"],
+            "wind_speed": current["wind_speed_10m"],
+            "temperature_max": daily["temperature_2m_max"][0],
+            "temperature_min": daily["temperature_2m_min"][0],
+            "precipitation_probability": daily["precipitation_probability_max"][0],
+        }
+
+
+class StaleWhileRevalidateCache:
+    def __init__(self, ttl=600, max_stale=3 * 3600):
+        """
+        Caches the results of an async fetch function.
+
+        Fresh values are returned directly. Stale values are returned
+        immediately while a refresh runs in the background. Concurrent fetches
+        of the same key share a single upstream call.
+
+        :param ttl: Seconds a value is fresh.
+        :param max_stale: Seconds a stale value may still be served.
+        """
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.entries = {}  # key -> (value, fetched_at)
+        self.in_flight = {}  # key -> asyncio.Task
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self, key, fetch):
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.max_stale:
+                self.stale_hits += 1
+                self._refresh(key, fetch)
+                return value
+
+        self.misses += 1
+        return await asyncio.shield(self._refresh(key, fetch))
+
+    def _refresh(self, key, fetch):
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, fetch))
+            self.in_flight[key] = task
+        return task
+
+    async def _fetch(self, key, fetch):
+        try:
+            value = await fetch(key)
+            self.entries[key] = (value, time.time())
+            return value
+        except Exception as e:
+            logging.warning(f"Failed to refresh {key!r}: {e}")
+            entry = self.entries.get(key)
+            if entry is None:
+                raise
+            return entry[0]
+        finally:
+            del self.in_flight[key]
+
+    def metrics(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "in_flight": len(self.in_flight),
+        }
+
+
+class Weather(Tool):
+    def __init__(
+        self,
+        provider=None,
+        telemetry=None,
+        default_location="Daejeon",
+        sensor_max_age=600,
+    ):
+        """
+        Reports the weather from the robot's own DHT11 sensor merged with a forecast.
+
+        :param provider: ForecastProvider, defaults to OpenMeteoProvider.
+        :param telemetry: SerialTelemetry to read the DHT11 from, if any.
+        :param default_location: Location used when the model does not give one.
+        :param sensor_max_age: Seconds after which a sensor reading is ignored.
+        """
+        self.provider = provider or OpenMeteoProvider()
+        self.telemetry = telemetry
+        self.default_location = default_location
+        self.sensor_max_age = sensor_max_age
+        self.cache = StaleWhileRevalidateCache()
+        self.name = "get_weather"
+        self.description = {
+            "type": "function",
+            "name": "get_weather",
+            "description": "Get the current weather and today's forecast for a location, along with the temperature and humidity measured by the robot in the field. Tell the user you are fetching the weather.",
+            "parameters": {
+                "type": "object",
+                "properties": {"location": {"type": "string"}},
+                "required": [],
+            },
+        }
+        self.function = self.get_weather
+
+    async def get_weather(self, arguments):
+        arguments = json.loads(arguments or "{}")
+        location = arguments.get("location") or self.default_location
+        logging.info(f"Fetching weather for {location}")
+
+        data = {"location": location, "unit": "Celcius"}
+        try:
+            data["forecast"] = await self.cache.get(location, self.provider.fetch)
+        except Exception as e:
+            logging.error(f"Failed to fetch forecast for {location}: {e}")
+
+        if self.telemetry is not None:
+            reading = self.telemetry.latest("DHT", max_age=self.sensor_max_age)
+            if reading is not None:
+                data["field_sensor"] = {
+                    "temperature": reading["temp"],
+                    "humidity": reading["hum"],
+                    "age_seconds": round(time.time() - reading["timestamp"]),
+                }
+
+        return data